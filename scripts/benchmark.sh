@@ -0,0 +1,36 @@
+#!/bin/bash
+# -----------------------------------------------------
+# Copyright (c) [2022] Nadege LEMPERIERE
+# All rights reserved
+# -------------------------------------------------------
+# Script to launch scenario benchmarks and compare them
+# to the tracked baseline
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @04 november 2022
+# Latest revision: 04 november 2022
+# -------------------------------------------------------
+
+# Retrieve absolute path to this script
+script=$(readlink -f $0)
+scriptpath=`dirname $script`
+
+cd $scriptpath/../
+
+# Create virtual environment
+python3 -m venv ${HOME}/mock
+. ${HOME}/mock/bin/activate
+
+# Gather parts database
+mkdir -p ${HOME}/.config/pyldraw
+echo "parts.lst: $scriptpath/../../parts/parts.lst" > ${HOME}/.config/pyldraw/config.yml
+
+# Install required python packages
+pip install --quiet --no-warn-script-location -r $scriptpath/../requirements-test.txt
+pip install --quiet --no-warn-script-location $scriptpath/../
+
+# Launch benchmarks, additional arguments are given to the benchmark harness
+python3 $scriptpath/../test/benchmark/benchmark.py $@
+result=$?
+
+deactivate
+exit $result
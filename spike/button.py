@@ -9,7 +9,6 @@
 # -------------------------------------------------------
 
 # Standard includes
-from time import sleep
 from threading import Lock
 
 # Local includes
@@ -43,15 +42,24 @@ class Button() :
         self.__is_pressed   = False
         self.__was_pressed  = False
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+
         self.s_shared_scenario.register(self, side)
 
     def wait_until_pressed(self) :
         """ Wait until the button is pressed"""
-        while not self.is_pressed() : sleep(0.01)
+        changes = self.s_shared_scenario.changes(self)
+        while not self.is_pressed() :
+            self.s_shared_scenario.wait(component=self, changes=changes)
+            changes = self.s_shared_scenario.changes(self)
 
     def wait_until_released(self) :
         """ Wait until the button is released"""
-        while self.is_pressed() :   sleep(0.01)
+        changes = self.s_shared_scenario.changes(self)
+        while self.is_pressed() :
+            self.s_shared_scenario.wait(component=self, changes=changes)
+            changes = self.s_shared_scenario.changes(self)
 
     def was_pressed(self) :
         """
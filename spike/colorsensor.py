@@ -9,12 +9,14 @@
 # -------------------------------------------------------
 
 # System includes
-from time       import sleep
 from threading  import Lock
 
 # Webcolors includes
 from webcolors import CSS3_HEX_TO_NAMES, hex_to_rgb
 
+# Numpy includes
+from numpy     import array, argmin
+
 # Local includes
 from spike.scenario.scenario import Scenario
 from spike.scenario.timer    import ScenarioTimer
@@ -162,6 +164,12 @@ class ColorSensor() :
         'black','violet','blue','cyan','green','yellow','red','white'
     }
 
+    # CSS3 palette computed once : rgb components and associated spike colors
+    s_palette        = array([hex_to_rgb(color_hex) for color_hex in CSS3_HEX_TO_NAMES], \
+        dtype = float)
+    s_palette_colors = list(map(s_css3_to_spike_colormap.get, \
+        CSS3_HEX_TO_NAMES.values(), CSS3_HEX_TO_NAMES.values()))
+
     # Static variables
     s_shared_scenario        = Scenario()
     s_shared_timer           = ScenarioTimer()
@@ -191,6 +199,10 @@ class ColorSensor() :
         self.__light_ratio      = 1
         self.__previous_color   = ''
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+        self.s_shared_timer    = ScenarioTimer()
+
         self.s_shared_scenario.register(self, port)
 
     def get_color(self) :
@@ -203,28 +215,20 @@ class ColorSensor() :
         result = None
 
         with self.__mutex :
-            selected_color = None
-            distance_min = 255*255*10
-            for color_hex, color_name in CSS3_HEX_TO_NAMES.items() :
-                rgb = hex_to_rgb(color_hex)
-                rmean = 0.5 * (rgb[0] + self.__red / 1024 * 255)
-                dred = (rgb[0] - self.__red / 1024 * 255)
-                dgreen = (rgb[1] - self.__green / 1024 * 255)
-                dblue = (rgb[2] - self.__blue / 1024 * 255)
-                distance = (2 + rmean / 256) * dred * dred + \
-                            4 * dgreen * dgreen + \
-                            ( 2 - (255 - rmean) / 256) * dblue * dblue
-                if distance < distance_min :
-                    distance_min = distance
-                    selected_color = color_name
-            result = selected_color
-            print(str(result))
-
-            if result in self.s_css3_to_spike_colormap :
-                result = self.s_css3_to_spike_colormap[result]
-
-            print(str(result))
-            if result not in self.s_allowed_colors : result = None
+            rgb = array([self.__red, self.__green, self.__blue], dtype = float)
+
+        # Redmean distance to all the palette colors at once
+        rgb = rgb / 1024 * 255
+        rmean = 0.5 * (self.s_palette[:,0] + rgb[0])
+        delta = self.s_palette - rgb
+        distance = (2 + rmean / 256) * delta[:,0] * delta[:,0] + \
+                    4 * delta[:,1] * delta[:,1] + \
+                    ( 2 - (255 - rmean) / 256) * delta[:,2] * delta[:,2]
+        i_color = int(argmin(distance))
+        if distance[i_color] < 255*255*10 :
+            result = self.s_palette_colors[i_color]
+
+        if result not in self.s_allowed_colors : result = None
 
         return result
 
@@ -316,8 +320,10 @@ class ColorSensor() :
         :type color:  string ("black","violet","blue","cyan","green","yellow","red","white")
         """
 
+        changes = self.s_shared_scenario.changes(self)
         while self.get_color() != color :
-            sleep(self.s_shared_timer.s_sleep_time)
+            self.s_shared_scenario.wait(component=self, changes=changes)
+            changes = self.s_shared_scenario.changes(self)
 
     def wait_for_new_color(self) :
         """
@@ -337,8 +343,10 @@ class ColorSensor() :
             self.__previous_color = self.get_color()
             result = self.__previous_color
         else :
+            changes = self.s_shared_scenario.changes(self)
             while self.get_color() == self.__previous_color :
-                sleep(self.s_shared_timer.s_sleep_time)
+                self.s_shared_scenario.wait(component=self, changes=changes)
+                changes = self.s_shared_scenario.changes(self)
             result = self.get_color()
             self.__previous_color = ''
 
@@ -405,10 +413,7 @@ class ColorSensor() :
         :type command: generator function
         """
 
-        shall_continue = next(command)
-        while shall_continue :
-            sleep(self.s_shared_timer.s_sleep_time)
-            shall_continue = next(command)
+        self.s_shared_scenario.process(command)
 
 ######################################## SCENARIO METHODS ########################################
 
@@ -9,9 +9,6 @@ emulating spike timer interfaces on standard python """
 # Latest revision: 04 november 2022
 # -------------------------------------------------------
 
-# System includes
-from time import sleep
-
 # Local includes
 from spike.scenario.scenario import Scenario
 from spike.scenario.timer import ScenarioTimer
@@ -35,6 +32,9 @@ class Timer() :
     def __init__(self) :
         """ Contructor """
         self.__reference_time    = -1
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+        self.s_shared_timer    = ScenarioTimer()
         self.s_shared_scenario.register(self)
 
     def now(self) :
@@ -68,10 +68,11 @@ def wait_for_seconds(seconds) :
         raise ValueError('seconds is not at least 0')
 
     timer = ScenarioTimer()
+    scenario = Scenario()
 
     reference_time  = timer.time()
     while (timer.time() - reference_time) < seconds :
-        sleep(0.01)
+        scenario.wait(reference_time + seconds)
 
 def wait_until(get_value_function, operator_function=equal_to, target_value=True) :
     """
@@ -96,6 +97,9 @@ def wait_until(get_value_function, operator_function=equal_to, target_value=True
     if not callable(operator_function) :
         raise TypeError('operator_function is not callable')
 
+    scenario = Scenario()
+
     current = get_value_function()
     while not operator_function(current, target_value) :
-        sleep(0.01)
+        scenario.wait()
+        current = get_value_function()
@@ -9,14 +9,13 @@
 # -------------------------------------------------------
 
 # System includes
-from time       import sleep
 from threading  import Lock
 
 # Local includes
 from spike.scenario.scenario import Scenario
 from spike.scenario.timer    import ScenarioTimer
 
-# pylint: disable=W0238
+# pylint: disable=W0238, R0902
 class DistanceSensor() :
     """ Distance sensor mocking class
 
@@ -52,6 +51,10 @@ class DistanceSensor() :
         self.__left_bottom   = 100
         self.__distance      = 0
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+        self.s_shared_timer    = ScenarioTimer()
+
         self.s_shared_scenario.register(self, port)
 
     def get_distance_cm(self, short_range=False) :
@@ -140,6 +143,7 @@ class DistanceSensor() :
         if not isinstance(unit,str) :
             raise TypeError('unit is not a string')
 
+        changes = self.s_shared_scenario.changes(self)
         measure = self.s_max_distance
         if unit == 'cm'       : measure = self.get_distance_cm(short_range)
         elif unit == 'inch'   : measure = self.get_distance_inches(short_range)
@@ -147,7 +151,8 @@ class DistanceSensor() :
         else : raise ValueError('unit is not one of the allowed values.')
         if measure is None  : measure = 100000
         while measure < distance :
-            sleep(0.01)
+            self.s_shared_scenario.wait(component=self, changes=changes)
+            changes = self.s_shared_scenario.changes(self)
             measure = self.s_max_distance
             if unit == 'cm'     : measure = self.get_distance_cm(short_range)
             if unit == 'inch'   : measure = self.get_distance_inches(short_range)
@@ -176,13 +181,15 @@ class DistanceSensor() :
         if not isinstance(unit,str) :
             raise TypeError('unit is not a string')
 
+        changes = self.s_shared_scenario.changes(self)
         measure = None
         if unit == 'cm'     : measure = self.get_distance_cm(short_range)
         if unit == 'inch'   : measure = self.get_distance_inches(short_range)
         if unit == '%'      : measure = self.get_distance_percentage(short_range)
         if measure is None  : measure = 100000
         while measure > distance :
-            sleep(0.01)
+            self.s_shared_scenario.wait(component=self, changes=changes)
+            changes = self.s_shared_scenario.changes(self)
             measure = None
             if unit == 'cm'     : measure = self.get_distance_cm(short_range)
             if unit == 'inch'   : measure = self.get_distance_inches(short_range)
@@ -265,10 +272,7 @@ class DistanceSensor() :
         :type command: generator function
         """
 
-        shall_continue = next(command)
-        while shall_continue :
-            sleep(self.s_shared_timer.s_sleep_time)
-            shall_continue = next(command)
+        self.s_shared_scenario.process(command)
 
 ######################################## SCENARIO METHODS ########################################
 
@@ -355,4 +359,4 @@ class DistanceSensor() :
         """
         with self.__mutex :
             self.__port = port
-# pylint: enable=W0238, R0801
+# pylint: enable=W0238, R0801, R0902
@@ -9,7 +9,6 @@
 # -------------------------------------------------------
 
 # Standard includes
-from time import sleep
 from threading import Lock
 
 # Local includes
@@ -45,19 +44,26 @@ class ForceSensor() :
 
         self.__force        = 0
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+
         self.s_shared_scenario.register(self, port)
 
     def wait_until_pressed(self) :
         """ Waits until the Force Sensor is pressed. """
 
+        changes = self.s_shared_scenario.changes(self)
         while self.get_force_newton() < self.s_force_for_being_pressed :
-            sleep(0.01)
+            self.s_shared_scenario.wait(component=self, changes=changes)
+            changes = self.s_shared_scenario.changes(self)
 
     def wait_until_released(self) :
         """ Waits until the Force Sensor is released. """
 
+        changes = self.s_shared_scenario.changes(self)
         while self.get_force_newton() >= self.s_force_for_being_pressed :
-            sleep(0.01)
+            self.s_shared_scenario.wait(component=self, changes=changes)
+            changes = self.s_shared_scenario.changes(self)
 
     def is_pressed(self) :
         """
@@ -134,6 +134,10 @@ class LightMatrix() :
 
         self.__matrix = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+        self.s_shared_timer    = ScenarioTimer()
+
         self.s_shared_scenario.register(self)
 
 # pylint: enable=W0102
@@ -235,10 +239,7 @@ class LightMatrix() :
         :type command: generator function
         """
 
-        shall_continue = next(command)
-        while shall_continue :
-            sleep(self.s_shared_timer.s_sleep_time)
-            shall_continue = next(command)
+        self.s_shared_scenario.process(command)
 
 ######################################## SCENARIO METHODS ########################################
 
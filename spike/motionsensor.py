@@ -9,7 +9,6 @@
 # -------------------------------------------------------
 
 # System includes
-from time import sleep
 from threading import Lock
 
 # Local includes
@@ -55,6 +54,9 @@ class MotionSensor() :
         self.__wait_gesture = None
         self.__zero_yaw_angle = 0
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+
         self.s_shared_scenario.register(self)
 
     def get_roll_angle(self) :
@@ -171,8 +173,10 @@ class MotionSensor() :
         """ Waits until a new gesture happens. """
 
         initial_gesture = self.get_gesture()
+        changes = self.s_shared_scenario.changes(self)
         while initial_gesture == self.get_gesture() :
-            sleep(0.01)
+            self.s_shared_scenario.wait(component=self, changes=changes)
+            changes = self.s_shared_scenario.changes(self)
 
     def wait_for_new_orientation(self) :
         """
@@ -191,8 +195,11 @@ class MotionSensor() :
             self.__wait_gesture = result
 
         else :
+            changes = self.s_shared_scenario.changes(self)
+            result = self.get_orientation()
             while self.__wait_gesture == result :
-                sleep(0.01)
+                self.s_shared_scenario.wait(component=self, changes=changes)
+                changes = self.s_shared_scenario.changes(self)
                 result = self.get_orientation()
             self.__wait_gesture = None
 
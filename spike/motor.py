@@ -10,7 +10,6 @@
 
 # System includes
 from threading import Lock
-from time import sleep
 
 # Local includes
 from spike.scenario.scenario import Scenario
@@ -74,6 +73,10 @@ class Motor() :
         self.__delta_degrees            = 0
         self.__default_speed            = self.s_max_speed
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+        self.s_shared_timer    = ScenarioTimer()
+
         self.s_shared_scenario.register(self, port)
 
     def run_to_position(self, degrees, direction='shortest path', speed=None) :
@@ -468,10 +471,7 @@ class Motor() :
         :type command: generator function
         """
 
-        shall_continue = next(command)
-        while shall_continue :
-            sleep(self.s_shared_timer.s_sleep_time)
-            shall_continue = next(command)
+        self.s_shared_scenario.process(command)
 
 ######################################## SCENARIO METHODS ########################################
 
@@ -10,13 +10,12 @@
 
 # System includes
 from threading import Lock
-from time      import sleep
 
 # Local includes
 from spike.scenario.scenario    import Scenario
 from spike.scenario.timer       import ScenarioTimer
 
-# pylint: disable=W0238, R0801
+# pylint: disable=W0238, R0801, R0902
 class MotorPair() :
     """ MotorPair mocking class
 
@@ -68,6 +67,10 @@ class MotorPair() :
         self.__left             = None
         self.__right            = None
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+        self.s_shared_timer    = ScenarioTimer()
+
         self.s_shared_scenario.register(self, left_port, right_port)
 
     def move(self, amount, unit='cm', steering=0, speed=None) :
@@ -524,10 +527,7 @@ class MotorPair() :
         :type command: generator function
         """
 
-        shall_continue = next(command)
-        while shall_continue :
-            sleep(self.s_shared_timer.s_sleep_time)
-            shall_continue = next(command)
+        self.s_shared_scenario.process(command)
 
 ######################################## SCENARIO METHODS ########################################
 
@@ -614,4 +614,4 @@ class MotorPair() :
         with self.__mutex :
             self.__right = right
 
-# pylint: enable=W0238, R0801
+# pylint: enable=W0238, R0801, R0902
@@ -8,12 +8,15 @@
 # Latest revision: 08 march 2022
 # -------------------------------------------------------
 
-# Openpyxl includes
-from openpyxl import load_workbook
+# Numpy includes
+from numpy import ndarray
+
+# Local includes
+from spike.scenario.workbook import ScenarioWorkbook
 
 class ScenarioAbaqus() :
     """ Class storing a robot abaqus
-        The abaqus is provided as an excel workbook linking an input
+        The abaqus is provided as a workbook linking an input
         to one or more values. The abaqus topics are derived from the
         workbook sheet headers
     """
@@ -27,29 +30,32 @@ class ScenarioAbaqus() :
     def read(self, filename, sheet) :
         """ Load an abaqus from an input workbook sheet content
 
-        :param filename: name of the workbook file to read data from
+        :param filename: name of the workbook file (excel, csv or npz) to read data from
         :type filename:  string
         :param sheet:    name of the workbook sheet containing the abaqus
         :type sheet:     string
 
         """
 
-         # Open workbook and load sheets
-        wbook = load_workbook(filename, data_only = True)
-        sheet = wbook[sheet]
+        # Forget the previously loaded abaqus
+        self.__data = {}
+
+         # Open workbook and load sheet
+        columns = [(header, values.tolist() if isinstance(values, ndarray) else values) \
+            for header, values in ScenarioWorkbook(filename).read(sheet).items()]
+        if len(columns) == 0 : return
+        commands = columns[0][1]
 
         # Associate header to column
-        i_row = 2
-        command = sheet.cell(i_row,1).value
-        while command is not None :
-            i_col = 2
-            while sheet.cell(i_row,i_col).value is not None :
-                if sheet.cell(1,i_col).value not in self.__data :
-                    self.__data[sheet.cell(1,i_col).value] = {}
-                self.__data[sheet.cell(1,i_col).value][command] = sheet.cell(i_row,i_col).value
+        i_row = 0
+        while i_row < len(commands) and commands[i_row] is not None :
+            i_col = 1
+            while i_col < len(columns) and columns[i_col][1][i_row] is not None :
+                if columns[i_col][0] not in self.__data :
+                    self.__data[columns[i_col][0]] = {}
+                self.__data[columns[i_col][0]][commands[i_row]] = columns[i_col][1][i_row]
                 i_col += 1
             i_row += 1
-            command = sheet.cell(i_row,1).value
 
     def get(self, topic, command) :
         """ Get abaqus value for a given command
@@ -0,0 +1,327 @@
+# -------------------------------------------------------
+# Copyright (c) [2022] Nadege LEMPERIERE
+# All rights reserved
+# -------------------------------------------------------
+""" Scenario parameter sweeps management """
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @04 november 2022
+# Latest revision: 04 november 2022
+# -------------------------------------------------------
+
+# System includes
+from json                   import load, dump, dumps
+from os                     import path, cpu_count
+from shutil                 import rmtree
+from tempfile               import mkdtemp
+from itertools              import product
+from importlib              import import_module
+from argparse               import ArgumentParser
+from concurrent.futures     import ProcessPoolExecutor
+from multiprocessing        import get_context
+from logging                import getLogger
+
+# Numpy includes
+from numpy                  import array, savez
+
+# Local includes
+from spike.scenario.scenario    import Scenario
+from spike.scenario.model       import ScenarioModel
+from spike.scenario.ground      import ScenarioGround
+
+class ScenarioBatch() :
+    """ Class running a scenario over a grid of initial coordinates, abaqus and missions
+        Each job of the grid runs an independent scenario in a pool of processes. The robot model
+        and the mat are loaded once per process before the first job, the following jobs using
+        the compiled model and the decoded mat from the process caches. The configuration files
+        of each job are derived from the batch configuration files in a temporary directory.
+
+        A mission is a function taking the started scenario as argument, which creates the
+        software components and drives them until the mission is over. Since missions are run in
+        other processes, they shall be given as module level functions or as 'module:function'
+        strings, importable from the python path. The processes are spawned rather than forked, so
+        that they never inherit the threads and locks of the scenarios already running in the
+        calling process. A job lasting more steps than the recorder capacity fails, instead of
+        returning truncated traces.
+    """
+
+    s_logger = getLogger('scenario')
+
+    def __init__(self, scenario, robot, workers = None, capacity = None) :
+        """ Constructor
+
+        :param scenario: scenario configuration file path, in compute mode
+        :type scenario:  string
+        :param robot:    robot configuration file path
+        :type robot:     string
+        :param workers:  number of processes running the jobs, default is None for one
+         process per processor
+        :type workers:   integer
+        :param capacity: maximum number of steps recorded per job, default is None for the
+         recorder default. Jobs lasting more steps fail
+        :type capacity:  integer
+
+        :raises ValueError: scenario not in compute mode
+        """
+
+        self.__scenario = {}
+        with open(scenario, 'r', encoding='UTF-8') as file :
+            self.__scenario = load(file)
+            file.close()
+        if self.__scenario.get('data', {}).get('mode') != 'compute' :
+            raise ValueError('Batch scenario shall be in compute mode')
+
+        self.__robot = {}
+        with open(robot, 'r', encoding='UTF-8') as file :
+            self.__robot = load(file)
+            file.close()
+
+        self.__scenario_directory = path.dirname(path.abspath(scenario))
+        self.__robot_directory    = path.dirname(path.abspath(robot))
+        self.__workers            = workers
+        self.__capacity           = capacity
+        if self.__workers is None : self.__workers = cpu_count() or 1
+
+    def jobs(self, coordinates, abaqus = None, missions = None) :
+        """ Jobs of a grid
+
+        :param coordinates: initial robot coordinates to sweep
+        :type coordinates:  list of dictionaries {'north', 'east', 'yaw'}
+        :param abaqus:      abaqus workbook paths to sweep, default is None to use the robot
+         configuration one
+        :type abaqus:       list of strings
+        :param missions:    missions to sweep, default is None to let the robot idle during
+         one scenario step
+        :type missions:     list of callables or strings
+
+        :return: the jobs coordinates, abaqus and mission, in the grid order
+        :rtype:  list of dictionaries
+        """
+
+        result = []
+
+        if abaqus is None : abaqus = [None]
+        if missions is None : missions = [None]
+        for mission, workbook, coordinate in product(missions, abaqus, coordinates) :
+            result.append({ 'coordinates' : coordinate, 'abaqus' : workbook, 'mission' : mission })
+
+        return result
+
+    def run(self, coordinates, abaqus = None, missions = None) :
+        """ Run all the jobs of a grid
+
+        :param coordinates: initial robot coordinates to sweep
+        :type coordinates:  list of dictionaries {'north', 'east', 'yaw'}
+        :param abaqus:      abaqus workbook paths to sweep, default is None to use the robot
+         configuration one
+        :type abaqus:       list of strings
+        :param missions:    missions to sweep, default is None to let the robot idle during
+         one scenario step
+        :type missions:     list of callables or strings
+
+        :return: for each job in the grid order, its parameters, the mission result or error,
+         and the robot trajectory and sensors traces along the scenario steps
+        :rtype:  list of dictionaries
+        """
+
+        result = []
+
+        jobs = self.jobs(coordinates, abaqus, missions)
+        directory = mkdtemp(prefix = 'spike-batch-')
+        try :
+            # Derive a robot configuration per abaqus and a scenario configuration per job
+            robots = {}
+            for workbook in dict.fromkeys([job['abaqus'] for job in jobs]) :
+                robots[workbook] = self.__derive_robot(directory, workbook, len(robots))
+            tasks = []
+            for i_job, job in enumerate(jobs) :
+                tasks.append((self.__derive_scenario(directory, job['coordinates'], i_job),
+                              robots[job['abaqus']], job['mission'], self.__capacity))
+
+            self.s_logger.info('Running %d jobs on %d processes', len(tasks), self.__workers)
+            with ProcessPoolExecutor(max_workers = self.__workers,
+                                     mp_context = get_context('spawn'),
+                                     initializer = ScenarioBatch.preload,
+                                     initargs = (tasks[0][0], list(robots.values()))) as pool :
+                for job, output in zip(jobs, pool.map(ScenarioBatch.execute, tasks)) :
+                    output['coordinates'] = job['coordinates']
+                    output['abaqus'] = job['abaqus']
+                    output['mission'] = self.__name(job['mission'])
+                    result.append(output)
+        finally :
+            rmtree(directory, ignore_errors = True)
+
+        return result
+
+    @staticmethod
+    def preload(scenario, robots) :
+        """
+        Static method loading the robot models and the mat in the process caches
+        Called once by each process of the pool before its first job
+
+        :param scenario: scenario configuration file path
+        :type scenario:  string
+        :param robots:   robot configuration files paths
+        :type robots:    list of strings
+        """
+
+        for robot in robots :
+            ScenarioModel().configure(robot)
+
+        conf = {}
+        with open(scenario, 'r', encoding='UTF-8') as file :
+            conf = load(file)
+            file.close()
+        if 'ground' in conf :
+            ScenarioGround().configure(conf['ground'], path.dirname(scenario))
+
+    @staticmethod
+    def execute(task) :
+        """
+        Static method running a job in an independent scenario
+
+        :param task: scenario and robot configuration files paths, mission and number of
+         steps recorded
+        :type task:  tuple (string, string, callable or string, integer)
+
+        :return: the mission result or error, and the robot trajectory and sensors traces.
+         The job fails if the traces do not hold all the scenario steps
+        :rtype:  dictionary
+        """
+
+        scenario_file, robot_file, mission, capacity = task
+
+        result = { 'result' : None, 'error' : None, 'trajectory' : {}, 'sensors' : {} }
+
+        recorder = None
+        scenario = Scenario(shared = False)
+        with scenario.bind() :
+# pylint: disable=W0703
+            try :
+                scenario.configure(scenario_file, robot_file)
+                recorder = scenario.record(capacity)
+                scenario.start()
+                if mission is None : scenario.wait()
+                else : result['result'] = ScenarioBatch.__resolve(mission)(scenario)
+            except Exception as exc :
+                result['error'] = type(exc).__name__ + ': ' + str(exc)
+# pylint: enable=W0703
+            scenario.reset()
+
+        if recorder is not None and recorder.dropped() > 0 and result['error'] is None :
+            result['error'] = 'RuntimeError: ' + str(recorder.dropped()) + \
+                ' steps exceeding the recorder capacity of ' + str(recorder.capacity()) + \
+                ' steps were dropped'
+
+        if recorder is not None :
+            content = recorder.data()
+            for i_column, name in enumerate(recorder.columns()) :
+                if name in ['time', 'north', 'east', 'yaw', 'pitch', 'roll'] :
+                    result['trajectory'][name] = content[:, i_column]
+                else : result['sensors'][name] = content[:, i_column]
+
+        return result
+
+    @staticmethod
+    def save(results, filename) :
+        """
+        Static method saving batch results in a numpy archive
+        Each job arrays are stored under the job index, the jobs parameters and mission
+        results being stored as json in the 'jobs' entry
+
+        :param results:  batch results, as returned by run
+        :type results:   list of dictionaries
+        :param filename: numpy archive path
+        :type filename:  string
+        """
+
+        arrays = {}
+        jobs = []
+        for i_job, output in enumerate(results) :
+            jobs.append({ 'coordinates' : output['coordinates'], 'abaqus' : output['abaqus'],
+                          'mission' : output['mission'], 'result' : repr(output['result']),
+                          'error' : output['error'] })
+            for name, values in output['trajectory'].items() :
+                arrays[str(i_job) + '/' + name] = values
+            for name, values in output['sensors'].items() :
+                arrays[str(i_job) + '/' + name] = values
+        arrays['jobs'] = array(dumps(jobs))
+
+        with open(filename, 'wb') as file :
+            savez(file, **arrays)
+            file.close()
+
+    def __derive_robot(self, directory, workbook, index) :
+        """ Write the robot configuration using an abaqus workbook in the batch directory """
+
+        conf = dict(self.__robot)
+        conf['design'] = dict(self.__robot['design'])
+        conf['design']['filename'] = path.relpath(
+            path.join(self.__robot_directory, self.__robot['design']['filename']), directory)
+        if workbook is None : workbook = path.join(self.__robot_directory, self.__robot['abaqus'])
+        conf['abaqus'] = path.relpath(path.abspath(workbook), directory)
+
+        result = path.join(directory, 'robot-' + str(index) + '.json')
+        with open(result, 'w', encoding='UTF-8') as file :
+            dump(conf, file)
+            file.close()
+
+        return result
+
+    def __derive_scenario(self, directory, coordinates, index) :
+        """ Write the scenario configuration starting from coordinates in the batch directory """
+
+        conf = dict(self.__scenario)
+        conf['data'] = dict(self.__scenario['data'])
+        conf['data']['coordinates'] = coordinates
+        if 'ground' in self.__scenario :
+            conf['ground'] = dict(self.__scenario['ground'])
+            conf['ground']['image'] = path.relpath(
+                path.join(self.__scenario_directory, self.__scenario['ground']['image']), directory)
+
+        result = path.join(directory, 'scenario-' + str(index) + '.json')
+        with open(result, 'w', encoding='UTF-8') as file :
+            dump(conf, file)
+            file.close()
+
+        return result
+
+    @staticmethod
+    def __resolve(mission) :
+        """ Mission function from a callable or a 'module:function' string """
+        result = mission
+        if isinstance(mission, str) :
+            module, function = mission.split(':')
+            result = getattr(import_module(module), function)
+        return result
+
+    @staticmethod
+    def __name(mission) :
+        """ Mission name for the results """
+        result = None
+        if isinstance(mission, str) : result = mission
+        elif mission is not None : result = mission.__module__ + ':' + mission.__qualname__
+        return result
+
+def main() :
+    """ Batch runner command line entry point """
+
+    parser = ArgumentParser(description = 'Run a scenario over a grid of parameters')
+    parser.add_argument('--scenario', required = True, help = 'scenario configuration file')
+    parser.add_argument('--robot', required = True, help = 'robot configuration file')
+    parser.add_argument('--grid', required = True,
+        help = 'json file with coordinates, abaqus and missions lists')
+    parser.add_argument('--output', required = True, help = 'numpy archive to store results in')
+    parser.add_argument('--workers', type = int, default = None, help = 'number of processes')
+    args = parser.parse_args()
+
+    grid = {}
+    with open(args.grid, 'r', encoding='UTF-8') as file :
+        grid = load(file)
+        file.close()
+
+    batch = ScenarioBatch(args.scenario, args.robot, args.workers)
+    results = batch.run(grid['coordinates'], grid.get('abaqus'), grid.get('missions'))
+    ScenarioBatch.save(results, args.output)
+
+if __name__ == '__main__' :
+    main()
@@ -8,6 +8,10 @@
 # Latest revision: 04 november 2022
 # -------------------------------------------------------
 
+# System includes
+from time                   import sleep
+from threading              import Lock, Event
+
 # Local includes
 from spike.scenario.timer   import ScenarioTimer
 
@@ -16,11 +20,23 @@ class ScenarioCommands() :
 
     s_shared_timer = ScenarioTimer()
 
-    def __init__(self) :
-        """ Constructor """
+    def __init__(self, timer = None) :
+        """ Constructor
+
+        :param timer: scenario clock, default is None to use the process-wide clock
+        :type timer:  ScenarioTimer
+        """
+        if timer is not None : self.s_shared_timer = timer
+
         self.__logs       = []
         self.__dynamics   = None
 
+        # Commands processed along scenario steps
+        self.__mutex      = Lock()
+        self.__pending    = []
+        self.__is_open    = False
+        self.__listener   = None
+
     def reset(self) :
         """ Commands reset function """
         self.__logs       = []
@@ -35,6 +51,94 @@ class ScenarioCommands() :
         self.__dynamics = dynamics
         self.reset()
 
+    def open(self, listener = None) :
+        """
+        Start processing commands along scenario steps - Called by the scenario thread
+
+        :param listener: function called each time a command is handed over to the scenario
+         thread, default is None
+        :type listener:  callable
+        """
+        with self.__mutex :
+            self.__is_open = True
+            self.__listener = listener
+
+    def close(self) :
+        """
+        Stop processing commands along scenario steps - Called by the scenario thread
+        Commands still pending are released so that no caller remains blocked
+        """
+        with self.__mutex :
+            self.__is_open = False
+            self.__listener = None
+            for pending in self.__pending :
+                pending['done'].set()
+            self.__pending = []
+
+    def process(self, command) :
+        """
+        Process command until over
+        The first command step is performed by the calling thread. If the command is not
+        over, the following steps are performed by the scenario thread after each scenario
+        update, so that the command is evaluated exactly once per step. The calling thread
+        is blocked until the command is over
+
+        :param command: command to process
+        :type command:  generator function
+        """
+
+        shall_continue = next(command)
+        if not shall_continue : return
+
+        pending = { 'command' : command, 'done' : Event(), 'errors' : [] }
+        with self.__mutex :
+            is_open = self.__is_open
+            listener = self.__listener
+            if is_open : self.__pending.append(pending)
+
+        if is_open :
+            if listener is not None : listener()
+            pending['done'].wait()
+            for error in pending['errors'] : raise error
+        else :
+            # No scenario thread to process the command, poll it along time
+            while shall_continue :
+                sleep(self.s_shared_timer.s_sleep_time)
+                shall_continue = next(command)
+
+    def pending(self) :
+        """
+        Number of commands waiting for the scenario thread to be over
+
+        :return: number of pending commands
+        :rtype:  integer
+        """
+        with self.__mutex :
+            result = len(self.__pending)
+        return result
+
+    def advance(self) :
+        """ Perform one step of all pending commands - Called by the scenario thread """
+
+        with self.__mutex :
+            pendings = self.__pending
+            self.__pending = []
+
+        remaining = []
+        for pending in pendings :
+            shall_continue = False
+# pylint: disable=W0703
+            try :
+                shall_continue = next(pending['command'])
+            except Exception as exc :
+                pending['errors'].append(exc)
+# pylint: enable=W0703
+            if shall_continue : remaining.append(pending)
+            else : pending['done'].set()
+
+        with self.__mutex :
+            self.__pending = remaining + self.__pending
+
 # pylint: disable=R0915
     def give(self, component, name, args) :
         """
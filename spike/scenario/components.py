@@ -14,12 +14,25 @@ from logging        import getLogger
 # System includes
 from threading      import  Lock
 
+# Local includes
+from spike.scenario.trace   import ScenarioTrace
+
 # pylint: disable=R0902
 class ScenarioComponents() :
     """ Class managing all registered software components
      and their update along time """
 
     s_logger = getLogger('components')
+    s_trace  = ScenarioTrace('components')
+    s_headers = {
+        'Motor'          : ['_degrees'],
+        'ColorSensor'    : ['_red', '_green', '_blue', '_ambiant', '_reflected'],
+        'ForceSensor'    : ['_force'],
+        'DistanceSensor' : ['_distance'],
+        'Button'         : ['_is_pressed'],
+        'MotionSensor'   : ['yaw', 'pitch', 'roll', 'gesture']
+    }
+    """ Data headers read by the components in read mode, suffixing their port or side """
 
     def __init__(self) :
         """ Constructor """
@@ -35,6 +48,7 @@ class ScenarioComponents() :
         self.__status_light     = None
         self.__motion_sensor    = None
         self.__ports            = {}
+        self.__readings         = {}
 
     def reset(self) :
         """ reset method """
@@ -48,6 +62,7 @@ class ScenarioComponents() :
             self.__speaker          = None
             self.__status_light     = None
             self.__motion_sensor    = None
+            self.__readings         = {}
 
     def configure(self, model) :
         """
@@ -58,7 +73,7 @@ class ScenarioComponents() :
         """
         self.__ports = model.ports()
 
-    def register(self, component, port1, port2) :
+    def register(self, component, port1, port2, headers = None) :
         """
         Register a software component associated with the robot
 
@@ -68,10 +83,15 @@ class ScenarioComponents() :
         :type port1:      string
         :param port2:     second port to check
         :type port2:      string
+        :param headers:   headers of the data the components are updated from, default is None
+         if the components are not updated from data or not yet
+        :type headers:    list of strings
 
-        :raises ValueError: unknown component type
+        :raises ValueError: unknown component type or component measurements missing from data
         """
 
+        if headers is not None : self.__check(component, port1, headers)
+
         # register component according to their type
         cmp_type = str(type(component))
 
@@ -102,6 +122,25 @@ class ScenarioComponents() :
             else :
                 raise ValueError('Unknwon component type : ' + cmp_type)
 
+    def check(self, headers) :
+        """
+        Check that data provide the measurements of all the registered components
+
+        :param headers: headers of the data the components are updated from
+        :type headers:  list of strings
+
+        :raises ValueError: component measurements missing from data
+        """
+
+        with self.__mutex :
+            if self.__motion_sensor is not None :
+                self.__check(self.__motion_sensor, None, headers)
+            for registered in [self.__buttons, self.__motors, self.__distance_sensors,
+                               self.__color_sensors, self.__force_sensors] :
+                for name, component in registered.items() :
+                    if name not in ['pair', 'left', 'right'] :
+                        self.__check(component, name, headers)
+
     def update_from_data(self, time, data) :
         """
         Update component from synthetic data
@@ -110,35 +149,41 @@ class ScenarioComponents() :
         :type time:  float
         :param data: data to use to update components states
         :type data:  ScenarioData
+
+        :return:     the components which measurements changed
+        :rtype:      list
+
+        :raises ValueError: component measurement header not found in data
         """
-        self.s_logger.debug('Updating from data')
+        result = []
+
+        self.s_trace.trace('Updating from data')
+        values = data.sample(time)
         with self.__mutex :
-            if self.__motion_sensor is not None :
-                self.__motion_sensor.c_read(
-                    data.extrapolate('yaw', time),
-                    data.extrapolate('pitch', time),
-                    data.extrapolate('roll', time),
-                    data.extrapolate('gesture', time))
-            for name,button in self.__buttons.items() :
-                button.c_read(
-                    data.extrapolate(name + '_is_pressed', time))
-            for name,motor in self.__motors.items() :
-                if name not in ['pair', 'left', 'right'] :
-                    motor.c_read(
-                        data.extrapolate(name + '_degrees', time))
-            for name,distance in self.__distance_sensors.items() :
-                distance.c_read(
-                    data.extrapolate(name + '_distance', time))
-            for name,color in self.__color_sensors.items() :
-                color.c_read(
-                    data.extrapolate(name + '_red', time),
-                    data.extrapolate(name + '_green', time),
-                    data.extrapolate(name + '_blue', time),
-                    data.extrapolate(name + '_ambiant', time),
-                    data.extrapolate(name + '_reflected', time))
-            for name,force in self.__force_sensors.items() :
-                force.c_read(
-                    data.extrapolate(name + '_force', time))
+            try :
+                if self.__motion_sensor is not None :
+                    self.__read(self.__motion_sensor, result,
+                        values['yaw'], values['pitch'], values['roll'], values['gesture'])
+                for name,button in self.__buttons.items() :
+                    self.__read(button, result, values[name + '_is_pressed'])
+                for name,motor in self.__motors.items() :
+                    if name not in ['pair', 'left', 'right'] :
+                        self.__read(motor, result, values[name + '_degrees'])
+                for name,distance in self.__distance_sensors.items() :
+                    self.__read(distance, result, values[name + '_distance'])
+                for name,color in self.__color_sensors.items() :
+                    self.__read(color, result,
+                        values[name + '_red'],
+                        values[name + '_green'],
+                        values[name + '_blue'],
+                        values[name + '_ambiant'],
+                        values[name + '_reflected'])
+                for name,force in self.__force_sensors.items() :
+                    self.__read(force, result, values[name + '_force'])
+            except KeyError as exc :
+                raise ValueError('Header ' + str(exc.args[0]) + ' not found in data') from exc
+
+        return result
 
     def update_from_mecanics(self, time, dynamics) :
         """
@@ -148,24 +193,83 @@ class ScenarioComponents() :
         :type time:      float
         :param dynamics: robot dynamic state
         :type dynamics:  ScenarioDynamics
+
+        :return:         the components which measurements changed
+        :rtype:          list
         """
+        result = []
 
-        self.s_logger.debug('Updating from dynamics information')
+        self.s_trace.trace('Updating from dynamics information')
         dynamics.extrapolate(time)
-        current = dynamics.current()
         if self.__motion_sensor is not None :
-            self.__motion_sensor.c_read( current['yaw'], current['pitch'], current['roll'], None)
+            yaw, pitch, roll = dynamics.orientation()
+            self.__read(self.__motion_sensor, result, yaw, pitch, roll, None)
         for port, motor in self.__motors.items() :
             if port != 'pair' :
-                degrees = current['parts'][motor.port]['Motor'][0]['degrees']
-                motor.c_read(degrees)
-        for port, sensor in self.__color_sensors.items() :
-            if port in current['parts'] :
-                if 'ColorSensor' in current['parts'][sensor.port] :
-                    red =   current['parts'][sensor.port]['ColorSensor'][0]['red'] * 1024 / 255
-                    green = current['parts'][sensor.port]['ColorSensor'][0]['green'] * 1024 / 255
-                    blue =  current['parts'][sensor.port]['ColorSensor'][0]['blue'] * 1024 / 255
-                    sensor.c_read(red, green, blue ,0,1024)
+                self.__read(motor, result, dynamics.degrees(motor.port))
+        for sensor in self.__color_sensors.values() :
+            color = dynamics.color(sensor.port)
+            if color is not None :
+                self.__read(sensor, result, *self.color_measurements(*color))
+
+        return result
+
+    @staticmethod
+    def color_measurements(red, green, blue) :
+        """
+        Static method converting the color seen by a sensor into the color sensor measurements
+        Also applies to numpy arrays of colors components
+
+        :param red:   red component of the color seen
+        :type red:    float [0,255]
+        :param green: green component of the color seen
+        :type green:  float [0,255]
+        :param blue:  blue component of the color seen
+        :type blue:   float [0,255]
+        :return:      red, green, blue, ambiant and reflected intensities
+        :rtype:       tuple (float [0,1024])
+        """
+        return red * 1024 / 255, green * 1024 / 255, blue * 1024 / 255, 0, 1024
+
+    def __check(self, component, port, headers) :
+        """
+        Check that data provide the measurements of a component
+
+        :param component: component to check
+        :type component:  object (Button, ColorSensor,...)
+        :param port:      component port or button side
+        :type port:       string
+        :param headers:   headers of the data the components are updated from
+        :type headers:    list of strings
+
+        :raises ValueError: component measurements missing from data
+        """
+        name = type(component).__name__
+        if name in self.s_headers :
+            missing = []
+            for header in self.s_headers[name] :
+                if name != 'MotionSensor' : header = str(port) + header
+                if not header in headers : missing.append(header)
+            if len(missing) > 0 :
+                raise ValueError('Scenario data miss ' + ', '.join(missing) + \
+                    ' measurements for ' + name)
+
+    def __read(self, component, updated, *values) :
+        """
+        Update a component with new measurements and keep track of the components which
+        measurements changed since their previous update
+
+        :param component: component to update
+        :type component:  object (Button, ColorSensor,...)
+        :param updated:   list of changed components to complete
+        :type updated:    list
+        :param values:    measurements to give to the component
+        :type values:     tuple
+        """
+        component.c_read(*values)
+        if self.__readings.get(id(component)) != values :
+            self.__readings[id(component)] = values
+            updated.append(component)
 
     def __register_motor(self, component, port1, port2) :
         """
@@ -8,9 +8,13 @@
 # Latest revision: 04 november 2022
 # -------------------------------------------------------
 
-# Openpyxl includes
-from openpyxl import load_workbook
+# Numpy includes
+from numpy      import array, searchsorted, argsort, diff, any as np_any, ndarray, generic
 
+# Local includes
+from spike.scenario.workbook    import ScenarioWorkbook
+
+# pylint: disable=R0902
 class ScenarioData() :
     """ Class managing simulation data """
 
@@ -21,29 +25,52 @@ class ScenarioData() :
         """ Contructor for each instantiation / do nothing """
 
         self.__data         = {}
+        self.__times        = array([])
+        self.__kinds        = {}
+        self.__numerics     = []
+        self.__matrix       = array([])
+        self.__cursor       = (None, 0)
         self.__is_loaded    = False
 
-    def configure(self, filename, sheet) :
-        """ Read scenario data from excel file
+        # Streaming management
+        self.__source       = None
+        self.__rows         = None
+        self.__stream       = None
+        self.__offset       = 0
+
+    def configure(self, filename, sheet, stream = None) :
+        """ Read scenario data from workbook file
 
-        :param filename: path to excel file in which the scenario data are located
+        :param filename: path to workbook file (excel, csv or npz) in which the scenario data
+         are located
         :type filename:  string
         :param sheet:    sheet from which data shall be retrieved
         :type sheet:     string
+        :param stream:   number of rows to read at once when data shall be streamed along
+         scenario time instead of being loaded at once, default is None for no streaming
+        :type stream:    integer
+
+        :raises ValueError: time data not found or invalid stream size
         """
 
         self.__data = {}
+        self.__source = None
+        self.__rows = None
+        self.__stream = stream
 
-        # Open workbook and load sheet
-        wbook = load_workbook(filename, data_only = True)
-        content_sheet = wbook[sheet]
-
-        # Associate header with data
-        self.__data = self.__load_data(content_sheet)
+        if stream is None :
+            # Open workbook and associate header with data
+            self.__data = self.__load_data(ScenarioWorkbook(filename), sheet)
+        else :
+            if not isinstance(stream, int) or stream <= 0 :
+                raise ValueError('Stream size shall be a positive integer')
+            self.__source = (ScenarioWorkbook(filename), sheet)
+            self.__open()
 
         if not self.s_time_header in self.__data :
             raise ValueError('Time data not found')
 
+        self.__index()
         self.__is_loaded = True
 
     def extrapolate(self, header, time) :
@@ -65,27 +92,83 @@ class ScenarioData() :
 
         if not header in self.__data :
             raise ValueError('Header ' + header + 'not found in data')
-        last_time = self.__data[self.s_time_header][0]
-        last_data = self.__data[header][0]
-        found = False
-        for i_data, t_data in enumerate(self.__data[self.s_time_header]) :
-            if t_data > time and not found:
-                found = True
-                if  isinstance(last_data, (bool, str)) or \
-                    isinstance(self.__data[header][i_data], str) or \
-                    last_data is None or \
-                    self.__data[header][i_data] is None :
-                    result = last_data
-                elif isinstance(last_data, (int, float)) :
-                    result = ((t_data - time) * last_data + \
-                        (time - last_time) * self.__data[header][i_data]) / \
-                        (t_data - last_time)
-
-            last_time = t_data
-            last_data = self.__data[header][i_data]
+
+        self.__follow(time)
+        i_data = self.__locate(time)
+        if i_data < len(self.__times) :
+            values = self.__data[header]
+            last_data = values[max(i_data - 1, 0)]
+            next_data = values[i_data]
+            if isinstance(values, ndarray) :
+                last_data, next_data = last_data.item(), next_data.item()
+            if  i_data == 0 or \
+                isinstance(last_data, (bool, str)) or \
+                isinstance(next_data, str) or \
+                last_data is None or \
+                next_data is None :
+                result = last_data
+            elif isinstance(last_data, (int, float)) :
+                last_time = self.__times[i_data - 1]
+                next_time = self.__times[i_data]
+                result = float(((next_time - time) * last_data + \
+                    (time - last_time) * next_data) / \
+                    (next_time - last_time))
+
+        return result
+
+    def sample(self, time) :
+        """
+        Extrapolate all data at a given time in a single pass
+
+        :param time:   extrapolation date in seconds
+        :type time:    float
+
+        :return:       The extrapolated values at the input time for each header
+        :rtype:        dictionary
+        """
+
+        result = {}
+
+        self.__follow(time)
+        i_data = self.__locate(time)
+        if i_data >= len(self.__times) :
+            for header in self.__data :
+                result[header] = self.s_invalid_value
+        else :
+
+            # Numeric data are interpolated all at once
+            if i_data == 0 :
+                numerics = self.__matrix[:, 0]
+            else :
+                last_time = self.__times[i_data - 1]
+                next_time = self.__times[i_data]
+                numerics = ((next_time - time) * self.__matrix[:, i_data - 1] + \
+                    (time - last_time) * self.__matrix[:, i_data]) / \
+                    (next_time - last_time)
+            for i_header, header in enumerate(self.__numerics) :
+                result[header] = float(numerics[i_header])
+
+            # Other data
+            for header, kind in self.__kinds.items() :
+                if kind == 'step' :
+                    result[header] = self.__data[header][max(i_data - 1, 0)]
+                    if isinstance(result[header], generic) :
+                        result[header] = result[header].item()
+                elif kind == 'mixed' :
+                    result[header] = self.extrapolate(header, time)
 
         return result
 
+    def headers(self) :
+        """
+        Data headers accessor
+
+        :return: the headers of the loaded data
+        :rtype:  list of strings
+        """
+
+        return list(self.__data.keys())
+
     def is_loaded(self) :
         """
         Loaded status return function :
@@ -96,33 +179,162 @@ class ScenarioData() :
 
         return self.__is_loaded
 
-    def __load_data(self, sheet) :
+    def __index(self) :
+        """
+        Build the time index used for data lookup. Data are sorted by increasing time so that
+        the data surrounding a date can be found by dichotomy
         """
-        Reads data from the excel sheet
 
+        self.__times = array(self.__data[self.s_time_header], dtype = float)
+        if np_any(diff(self.__times) < 0) :
+            order = argsort(self.__times, kind = 'stable')
+            self.__times = self.__times[order]
+            for header, values in self.__data.items() :
+                if isinstance(values, ndarray) : self.__data[header] = values[order]
+                else : self.__data[header] = [values[i_data] for i_data in order]
+        self.__cursor = (None, 0)
+
+        # Classify data : numeric data are interpolated, boolean and string data are kept
+        # until next change, other data need to be checked value by value
+        self.__kinds = {}
+        self.__numerics = []
+        for header, values in self.__data.items() :
+            if isinstance(values, ndarray) and values.dtype.kind in 'iuf' :
+                self.__kinds[header] = 'numeric'
+                self.__numerics.append(header)
+            elif isinstance(values, ndarray) :
+                self.__kinds[header] = 'step'
+            elif all(isinstance(value, (int, float)) and not isinstance(value, bool) \
+                for value in values) :
+                self.__kinds[header] = 'numeric'
+                self.__numerics.append(header)
+            elif all(value is None or isinstance(value, (bool, str)) for value in values) :
+                self.__kinds[header] = 'step'
+            else :
+                self.__kinds[header] = 'mixed'
+        self.__matrix = array([self.__data[header] for header in self.__numerics],
+            dtype = float).reshape(len(self.__numerics), len(self.__times))
+
+    def __open(self) :
+        """ (Re)start data streaming from the beginning of the workbook sheet """
+
+        wbook, sheet = self.__source
+        self.__rows = wbook.rows(sheet)
+        self.__offset = 0
+        self.__data = {}
+        for header in next(self.__rows) :
+            self.__data[header] = []
+        self.__read(0)
+
+    def __read(self, time) :
+        """
+        Read the next rows from the streamed sheet, until the data go further than a given
+        date or the sheet is over
+
+        :param time: date in seconds the data shall go further than
+        :type time:  float
+
+        :raises ValueError: streamed data are not sorted by increasing time
+        """
+
+        headers = list(self.__data.keys())
+        times = self.__data.get(self.s_time_header, [])
+        count = 0
+        last_time = None
+        if len(times) > 0 : last_time = times[-1]
+        while self.__rows is not None and \
+              (count < self.__stream or last_time is None or last_time <= time) :
+            row = next(self.__rows, None)
+            if row is None :
+                self.__rows = None
+            else :
+                for i_column, header in enumerate(headers) :
+                    value = row[i_column]
+                    if isinstance(value,str) and value == 'True'  : value = True
+                    if isinstance(value,str) and value == 'False' : value = False
+                    self.__data[header].append(value)
+                if self.s_time_header in self.__data :
+                    if last_time is not None and self.__data[self.s_time_header][-1] < last_time :
+                        raise ValueError('Streamed data shall be sorted by increasing time')
+                    last_time = self.__data[self.s_time_header][-1]
+                count += 1
+
+    def __follow(self, time) :
+        """
+        Make streamed data cover a given date. Rows already processed are discarded, and rows
+        are read ahead until the data go further than the date. Streaming is restarted from
+        the beginning when the date goes backward further than the data kept in memory
+
+        :param time: date in seconds
+        :type time:  float
+        """
+
+        if self.__source is not None :
+
+            if self.__offset > 0 and time < self.__times[0] :
+                self.__open()
+                self.__index()
+
+            if self.__rows is not None and \
+               (len(self.__times) == 0 or self.__times[-1] <= time) :
+                i_keep = max(int(searchsorted(self.__times, time, side = 'right')) - 1, 0)
+                for header, values in self.__data.items() :
+                    self.__data[header] = values[i_keep:]
+                self.__offset += i_keep
+                self.__read(time)
+                self.__index()
+
+    def __locate(self, time) :
+        """
+        Find the index of the first data strictly after a given date
+        Scenario dates are increasing, and all the headers are extrapolated at the same date :
+        the previous result is kept to start from there, and dichotomy is only used when the
+        date moves further than the next data
+
+        :param time: date in seconds
+        :type time:  float
+
+        :return:     index of the first data strictly after the date, the number of data if
+         no data is after the date
+        :rtype:      integer
+        """
+
+        last_time, result = self.__cursor
+        if last_time != time :
+            if last_time is not None and time > last_time and \
+               (result == len(self.__times) or self.__times[result] > time) :
+                pass
+            elif last_time is not None and time > last_time and \
+               result + 1 < len(self.__times) and \
+               self.__times[result] <= time < self.__times[result + 1] :
+                result = result + 1
+            else :
+                result = int(searchsorted(self.__times, time, side = 'right'))
+            self.__cursor = (time, result)
+
+        return result
+
+    def __load_data(self, wbook, sheet) :
+        """
+        Reads data from the workbook sheet
+
+        :param wbook: workbook to read object status from
+        :type wbook:  ScenarioWorkbook
         :param sheet: sheet to read object status from
         :type sheet:  string
         """
 
-        result = {}
+        result = wbook.read(sheet)
 
-        # Associate header to column
-        i_column = 1
-        column_to_header = {}
-        header_to_column = {}
-        content = sheet.cell(1,i_column).value
-        while content is not None :
-            column_to_header[i_column]  = content
-            header_to_column[content]   = i_column
-            result[content] = []
-            i_column += 1
-            content = sheet.cell(1,i_column).value
-
-        for i_row in range(2,sheet.max_row + 1) :
-            for col,header in column_to_header.items() :
-                value = sheet.cell(i_row,col).value
-                if isinstance(value,str) and value == 'True'  : value = True
-                if isinstance(value,str) and value == 'False' : value = False
-                result[header].append(value)
+        for header, values in result.items() :
+            # Text arrays may hold booleans : they are converted as the other text columns
+            if isinstance(values, ndarray) and values.dtype.kind == 'U' :
+                values = result[header] = values.tolist()
+            if not isinstance(values, ndarray) :
+                for i_value, value in enumerate(values) :
+                    if isinstance(value,str) and value == 'True'  : values[i_value] = True
+                    if isinstance(value,str) and value == 'False' : values[i_value] = False
 
         return result
+
+# pylint: enable=R0902
@@ -9,40 +9,58 @@
 # -------------------------------------------------------
 
 # System includes
-from math       import fabs, pi, copysign
+from math       import fabs, pi, copysign, cos, sin, remainder
+from time       import perf_counter
 from threading  import Lock
 from logging    import getLogger
 
 
 # wpilib includes
-from wpimath.geometry   import Translation3d, Rotation3d, Pose3d, Twist3d
+from wpimath.geometry   import Translation3d, Rotation3d, Pose3d
 from wpimath.kinematics import DifferentialDriveKinematics, DifferentialDriveWheelSpeeds
 from wpimath.kinematics import ChassisSpeeds
 
 # multipledispatch includes
 from multipledispatch   import dispatch
 
+# numpy includes
+from numpy              import array
+
 # Local includes
 from spike.scenario.timer   import ScenarioTimer
-from spike.scenario.parts   import ScenarioPartWheel
+from spike.scenario.trace   import ScenarioTrace
+from spike.scenario.parts   import ScenarioPart, ScenarioPartWheel
 
 
-# pylint: disable=R0902
+# pylint: disable=R0902, R0904
 class ScenarioDynamics() :
-    """ Robot dynamics modelisation """
+    """ Robot dynamics modelisation
+        The robot moves on the mat plane : its state is made of its wheels center coordinates
+        and its yaw, integrated in closed form from the differential drive kinematics. Parts
+        follow the robot center and only derive their poses from it when they are read,
+        wpimath poses being only built for the end-user.
+        The measurements needed by the software components are gathered after each
+        extrapolation in a status record preallocated for the robot ports, and read through
+        fine-grained accessors.
+    """
 
     s_shared_timer = ScenarioTimer()
     s_logger       = getLogger('dynamics')
+    s_trace        = ScenarioTrace('dynamics')
 
-    def __init__(self, model, mat = None) :
+    def __init__(self, model, mat = None, timer = None) :
         """Constructor
 
         :param model: robot static structure model
         :type model:  ScenarioModel
         :param mat:   mat model
         :type mat:    ScenarioGround
+        :param timer: scenario clock, default is None to use the process-wide clock
+        :type timer:  ScenarioTimer
         """
 
+        if timer is not None : self.s_shared_timer = timer
+
         # Dynamics modelling objects
         self.__kinematics    = None
         self.__wheel_speeds  = None
@@ -51,12 +69,17 @@ class ScenarioDynamics() :
 
         # Current computation time
         self.__current_time  = -1
-        self.__current_pose  = None
+        self.__position      = None
+        self.__yaw           = 0
+
+        # Robot center record followed by the parts
+        self.__center        = { 'location' : None }
 
         # Get robot parts involved in dynamics
         self.__model         = model
         self.__mat           = mat
         self.__parts         = self.__model.all()
+        for part in self.__parts : part.follow(self.__center)
         self.__wheels        = {}
         self.__motors        = {}
         self.__colors        = {}
@@ -71,9 +94,32 @@ class ScenarioDynamics() :
             for sensor in by_type['ColorSensor'] :
                 self.__colors[sensor.port] = sensor
 
+        # Measurements status, updated in place after each extrapolation
+        self.__status        = {
+            'time'          : -1,
+            'position'      : (0, 0),
+            'orientation'   : (0, 0, 0),
+            'degrees'       : dict.fromkeys(self.__motors, 0),
+            'speeds'        : dict.fromkeys(self.__motors, 0),
+            'colors'        : dict.fromkeys(self.__colors, (0, 0, 0))
+        }
+
+        # Timing instrumentation
+        self.__profiler      = None
+
         # Protection
         self.__mutex         = Lock()
 
+    def profile(self, profiler) :
+        """
+        Measure the extrapolations phases durations
+
+        :param profiler: profiler recording the extrapolation and colors phases, None to stop
+         measuring
+        :type profiler:  ScenarioProfiler
+        """
+        self.__profiler = profiler
+
     def reset(self) :
         """ Reset function """
         with self.__mutex :
@@ -81,10 +127,14 @@ class ScenarioDynamics() :
             self.__current_time      = 0
             self.__wheel_speeds      = DifferentialDriveWheelSpeeds(0,0)
             self.__chassis_speed     = ChassisSpeeds(0,0,0)
-            self.__current_pose      = self.__initial_pose
-            for part in self.__parts :
-                part.derive_pose(self.__current_pose)
+            self.__position          = None
+            self.__yaw               = 0
+            if self.__initial_pose is not None :
+                self.__position = ScenarioPart.to_arrays(self.__initial_pose)[0]
+                self.__yaw = self.__initial_pose.rotation().z
+                self.__place()
             for motor in self.__motors.values() : motor.reset()
+            self.__snapshot()
 
     def configure(self, coordinates = None) :
         """
@@ -121,10 +171,10 @@ class ScenarioDynamics() :
         result = ''
 
         result += 'GLOBAL : date : ' + str(self.__current_time)
-        if self.__current_pose :
-            result += ', x : ' + str(self.__current_pose.translation().x)
-            result += ', y : ' + str(self.__current_pose.translation().y)
-            result += ', direction : ' + str(self.__modulo_dir(self.__current_pose.rotation().z))
+        if self.__position is not None :
+            result += ', x : ' + str(self.__position[0])
+            result += ', y : ' + str(self.__position[1])
+            result += ', direction : ' + str(self.__modulo_dir(self.__yaw))
         i_part = 0
         for part in self.__parts :
             result += '\n'
@@ -144,12 +194,15 @@ class ScenarioDynamics() :
         result = {}
 
         with self.__mutex :
+            pose = Pose3d(
+                Translation3d(self.__position[0], self.__position[1], self.__position[2]),
+                Rotation3d(0, 0, self.__yaw))
             result['time'] = self.__current_time
-            result['x'] = self.__current_pose.translation().x
-            result['y'] = self.__current_pose.translation().y
-            result['yaw'] = self.__modulo_dir(self.__current_pose.rotation().z)
-            result['pitch'] = self.__modulo_dir(self.__current_pose.rotation().y)
-            result['roll'] = self.__modulo_dir(self.__current_pose.rotation().x)
+            result['x'] = pose.translation().x
+            result['y'] = pose.translation().y
+            result['yaw'] = self.__modulo_dir(pose.rotation().z)
+            result['pitch'] = self.__modulo_dir(pose.rotation().y)
+            result['roll'] = self.__modulo_dir(pose.rotation().x)
             result['parts'] = {}
             for part in self.__parts :
                 if part.port not in result['parts'] : result['parts'][part.port] = {}
@@ -157,7 +210,21 @@ class ScenarioDynamics() :
                     result['parts'][part.port][part.type] = []
                 result['parts'][part.port][part.type].append(part.export())
 
-            self.s_logger.info(str(self))
+            self.s_trace.trace('%s', self)
+
+        return result
+
+    def is_idle(self) :
+        """ Check if the robot is motionless, in which case its status does not change with time
+
+        :return: True if no motor is rotating, False otherwise
+        :rtype:  boolean
+        """
+
+        result = True
+        with self.__mutex :
+            for motor in self.__motors.values() :
+                if motor.speed != 0 : result = False
 
         return result
 
@@ -229,7 +296,7 @@ class ScenarioDynamics() :
             for motor in self.__motors.values() :
                 if motor.side() in ScenarioPartWheel.s_sides is not None:
                     dist += fabs((motor.degrees - start[motor.side()]) * motor.radius())
-            self.s_logger.debug(
+            self.s_trace.trace(
                 'time %lf : distance is %lf for an amount of %lf ',
                 self.__current_time, dist, sum_degrees * famount)
 
@@ -349,7 +416,7 @@ class ScenarioDynamics() :
             for motor in self.__motors.values() :
                 if motor.side() in ScenarioPartWheel.s_sides :
                     dist += fabs((motor.degrees - start[motor.side()]) * motor.radius())
-            self.s_logger.debug(
+            self.s_trace.trace(
                 'time %lf : distance is %lf for an amount of %lf ',
                 self.__current_time, dist, 2 * amount)
 
@@ -628,25 +695,116 @@ class ScenarioDynamics() :
         else :
             delta_time = 0
 
+        profiler = self.__profiler
+        if profiler is not None : start = perf_counter()
+
         with self.__mutex :
-            twist = Twist3d(
-                self.__chassis_speed.vx * delta_time,
-                self.__chassis_speed.vy * delta_time,
-                0,
-                0,
-                0,
-                -self.__chassis_speed.omega * delta_time)
-            self.__current_pose = self.__current_pose.exp(twist)
+            # Exponential of the planar twist performed during delta time in robot frame
+            forward = self.__chassis_speed.vx * delta_time
+            lateral = self.__chassis_speed.vy * delta_time
+            theta = -self.__chassis_speed.omega * delta_time
+            if fabs(theta) < 1e-9 :
+                ratio_sin = 1 - theta * theta / 6
+                ratio_cos = theta / 2
+            else :
+                ratio_sin = sin(theta) / theta
+                ratio_cos = (1 - cos(theta)) / theta
+            forward, lateral = forward * ratio_sin - lateral * ratio_cos, \
+                               forward * ratio_cos + lateral * ratio_sin
+
+            # Displacement in NED frame - parts poses are only invalidated if the robot moved
+            if forward != 0 or lateral != 0 or theta != 0 :
+                cos_yaw = cos(self.__yaw)
+                sin_yaw = sin(self.__yaw)
+                self.__position = self.__position + array([
+                    cos_yaw * forward - sin_yaw * lateral,
+                    sin_yaw * forward + cos_yaw * lateral,
+                    0])
+                self.__yaw = remainder(self.__yaw + theta, 2 * pi)
+                self.__place()
 
-            for part in self.__parts :
-                part.derive_pose(self.__current_pose)
             for motor in self.__motors.values() :
                 motor.extrapolate(delta_time)
+            if profiler is not None :
+                profiler.record('extrapolation', perf_counter() - start)
+                start = perf_counter()
+
             for sensor in self.__colors.values() :
                 if self.__mat is not None:
                     sensor.read_color(self.__mat)
+            if profiler is not None :
+                profiler.record('colors', perf_counter() - start)
 
             self.__current_time = time
+            self.__snapshot()
+
+    def position(self) :
+        """ Robot center position accessor, as of the last extrapolation
+
+        :return: robot center north and east coordinates
+        :rtype:  tuple (float, float)
+        """
+        return self.__status['position']
+
+    def orientation(self) :
+        """ Robot orientation accessor, as of the last extrapolation
+
+        :return: robot yaw, pitch and roll
+        :rtype:  tuple (float (degrees) [-180,180])
+        """
+        return self.__status['orientation']
+
+    def degrees(self, port) :
+        """ Motor degrees accessor, as of the last extrapolation
+
+        :param port: motor port
+        :type port:  string (A, B, C, D, E or F)
+        :return:     motor displacement degrees, None if no motor is connected on port
+        :rtype:      float (degrees)
+        """
+        return self.__status['degrees'].get(port)
+
+    def speed(self, port) :
+        """ Motor speed accessor, as of the last extrapolation
+
+        :param port: motor port
+        :type port:  string (A, B, C, D, E or F)
+        :return:     motor rotation speed, None if no motor is connected on port
+        :rtype:      float (degrees per second)
+        """
+        return self.__status['speeds'].get(port)
+
+    def color(self, port) :
+        """ Color sensor reading accessor, as of the last extrapolation
+
+        :param port: color sensor port
+        :type port:  string (A, B, C, D, E or F)
+        :return:     red, green and blue components of the color read, None if no color
+         sensor is connected on port
+        :rtype:      tuple (float [0,255], float [0,255], float [0,255])
+        """
+        return self.__status['colors'].get(port)
+
+    def __snapshot(self) :
+        """ Update the measurements status in place from the robot state """
+
+        self.__status['time'] = self.__current_time
+        if self.__position is not None :
+            self.__status['position'] = (self.__position[0].item(), self.__position[1].item())
+        self.__status['orientation'] = (self.__modulo_dir(self.__yaw), 0.0, 0.0)
+        degrees = self.__status['degrees']
+        speeds = self.__status['speeds']
+        for port, motor in self.__motors.items() :
+            degrees[port] = motor.degrees * 180 / pi
+            speeds[port] = motor.speed * 180 / pi
+        colors = self.__status['colors']
+        for port, sensor in self.__colors.items() :
+            colors[port] = sensor.rgb
+
+    def __place(self) :
+        """ Publish the robot center new location, invalidating the parts poses """
+        north, east, down = self.__position.tolist()
+        self.__center['location'] = (north, east, down, self.__yaw)
 
     def __compute_motor_speeds_from_steering(self, steering, speed) :
         """
@@ -684,8 +842,8 @@ class ScenarioDynamics() :
         self.__wheel_speeds = DifferentialDriveWheelSpeeds(
             self.__wheels['left'].speed, self.__wheels['right'].speed)
         self.__chassis_speed = self.__kinematics.toChassisSpeeds(self.__wheel_speeds)
-        self.s_logger.info(' wheels speed : %s - chassis speed : %s',
-                           str(self.__wheel_speeds), str(self.__chassis_speed))
+        self.s_trace.trace(' wheels speed : %s - chassis speed : %s',
+                           self.__wheel_speeds, self.__chassis_speed)
     def __check_pair(self, left, right) :
         """
         Check if left and right ports connects pairable motors
@@ -739,4 +897,4 @@ class ScenarioDynamics() :
 
 
 
-# pylint: enable=R0902
+# pylint: enable=R0902, R0904
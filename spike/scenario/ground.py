@@ -9,24 +9,48 @@
 # -------------------------------------------------------
 
 # System includes
+from os         import path as ospath, stat, makedirs, replace, getpid
+from math       import floor, log2, tan, pi
+from hashlib    import sha1
 from logging    import getLogger
+from threading  import Lock
 
 # Pillow includes
 from PIL        import Image
 
+# Numpy includes
+from numpy      import array, asarray, zeros, minimum, uint8, save, load, ascontiguousarray
+from numpy      import concatenate, rint
+
 # pylint: disable=C0103
 class ScenarioGround() :
-    """ Scene mat modelling """
+    """ Scene mat modelling
+        The mat pixels are stored by square tiles, so that the pixels close on the mat are close
+        in memory. When shared, the tiles are written once in a raw file of the tiles directory
+        and memory mapped read-only : all the processes using the same mat share the same memory
+        and only the tiles actually sampled are read from disk.
+        The mat is stored as a pyramid of images, each level averaging the previous one pixels
+        2 by 2, so that the color seen by a sensor is sampled at the level matching its footprint.
+        Decoded mats are kept for the whole process, so that the scenarios running in parallel
+        in the same process share the same pixels.
+    """
 
     s_logger       = getLogger('ground')
+    s_tile_size    = 64
+    s_tiles_directory = ospath.join(ospath.expanduser('~'), '.cache', 'spike-mock')
+    """ Default directory of the shared mats tiles files """
+    s_cache        = {}
+    s_mutex        = Lock()
 
     def __init__(self) :
         """ Constructor """
         # Dynamics modelling objects
-        self.__mat    = None
-        self.__height = 0
-        self.__width  = 0
-        self.__scale  = 0
+        self.__levels   = []
+        self.__sizes    = []
+        self.__height   = 0
+        self.__width    = 0
+        self.__scale    = 0
+        self.__aperture = None
 
     def configure(self, conf, path) :
         """
@@ -36,27 +60,69 @@ class ScenarioGround() :
         :type conf:  dictionary
         :param path: configuration file path
         :type path:  string
+
+        :raises ValueError: missing image or scale information, invalid aperture or tiles
         """
         self.__check_configuration(conf)
 
         self.__scale = conf['scale']
+        self.__aperture = conf.get('aperture', None)
+        filename = path + '/' + conf['image']
 
-        with Image.open(path + '/' + conf['image']) as img:
-            self.__mat = img.convert("RGB").load()
-
-            # self.__mat = Image.new("RGB", img.size, (255, 255, 255))
-            # self.__mat.paste(img, mask=img.split()[3])
+        # Image size is read from the header, the pixels are only decoded if needed
+        with Image.open(filename) as img:
             self.__width, self.__height = img.size
 
+        # Pyramid levels size, down to a single pixel
+        self.__sizes = [(self.__width, self.__height)]
+        while max(self.__sizes[-1]) > 1 :
+            width, height = self.__sizes[-1]
+            self.__sizes.append(((width + 1) // 2, (height + 1) // 2))
+
+        self.__levels = []
+        if conf.get('shared', False) :
+            directory = self.s_tiles_directory
+            if 'tiles' in conf : directory = ospath.join(path, conf['tiles'])
+            self.__levels = self.__map(filename, directory)
+        if len(self.__levels) == 0 :
+            key = (ospath.abspath(filename), stat(filename).st_mtime_ns, self.s_tile_size)
+            with self.s_mutex :
+                self.__levels = self.s_cache.get(key, [])
+            if len(self.__levels) == 0 :
+                self.__levels = self.__decode(filename)
+                with self.s_mutex :
+                    self.s_cache[key] = self.__levels
+
+    def footprint(self, distance) :
+        """
+        Diameter of the mat area seen by a color sensor
+
+        :param distance: distance between the sensor and the mat along its axis in centimeters
+        :type distance:  float
+        :return:         footprint diameter in centimeters, 0 if no aperture is configured
+        :rtype:          float
+        """
+
+        result = 0
+        if self.__aperture is not None and distance > 0 :
+            result = 2 * distance * tan(self.__aperture * pi / 180)
+
+        return result
+
 # pylint: disable=R0914
-    def get_color(self, north, east) :
+    def get_color(self, north, east, footprint = 0) :
         """
         Get color from position on mat
 
-        :param north: north coordinate in centimeters
-        :type north:  float
-        :param east:  east coordinate in centimeters
-        :type east:   float
+        :param north:     north coordinate in centimeters
+        :type north:      float
+        :param east:      east coordinate in centimeters
+        :type east:       float
+        :param footprint: diameter of the area to average in centimeters, default is 0 to
+         sample the full resolution mat
+        :type footprint:  float
+        :return:          red, green and blue components of the mat color, 0 outside of the mat
+        :rtype:           dictionary
         """
 
         result = {
@@ -67,22 +133,42 @@ class ScenarioGround() :
         y = self.__height - north / self.__scale
         x = east / self.__scale
 
-        if self.__mat is not None and \
+        if len(self.__levels) > 0 and \
            0 <= y < self.__height and \
            0 <= x < self.__width :
 
+            level = self.__level(footprint)
+            tiles = self.__levels[level]
+            width, height = self.__sizes[level]
+            if level > 0 :
+                y = max(0, (y - ((1 << level) - 1) * 0.5) / (1 << level))
+                x = max(0, (x - ((1 << level) - 1) * 0.5) / (1 << level))
+
+            # Neighbour pixels, the last row and column being repeated on the mat border
             x0 = int(x)
             x1 = x0 + 1
-            if x1 >= self.__width : x1 = x0
+            xn = min(x1, width - 1)
 
             y0 = int(y)
-            y1 = int(y) + 1
-            if y1 >= self.__height : y1 = y0
+            y1 = y0 + 1
+            yn = min(y1, height - 1)
 
-            r00,g00,b00 = self.__mat[x0,y0]
-            r10,g10,b10 = self.__mat[x1,y0]
-            r01,g01,b01 = self.__mat[x0,y1]
-            r11,g11,b11 = self.__mat[x1,y1]
+            # Single point : converting the 4 neighbour pixels is cheaper than array operations
+            ty, py = divmod(y0, self.s_tile_size)
+            tx, px = divmod(x0, self.s_tile_size)
+            if py + yn - y0 < self.s_tile_size and px + xn - x0 < self.s_tile_size :
+                pixels = tiles[ty, tx, py:py + yn - y0 + 1, px:px + xn - x0 + 1].tolist()
+                r00,g00,b00 = pixels[0][0]
+                r10,g10,b10 = pixels[0][-1]
+                r01,g01,b01 = pixels[-1][0]
+                r11,g11,b11 = pixels[-1][-1]
+            else :
+                pixels = self.__pixels(tiles, \
+                    array([y0, y0, yn, yn]), array([x0, xn, x0, xn])).tolist()
+                r00,g00,b00 = pixels[0]
+                r10,g10,b10 = pixels[1]
+                r01,g01,b01 = pixels[2]
+                r11,g11,b11 = pixels[3]
 
             result['red']   = r00 * (x1 - x) * (y1 - y) + r10 * (x - x0) * (y1 - y) + \
                               r01 * (x1 - x) * (y - y0) + r11 * (x - x0) * (y - y0)
@@ -93,8 +179,180 @@ class ScenarioGround() :
 
         return result
 
+    def get_colors(self, points, footprint = 0) :
+        """
+        Get colors from a set of positions on mat, using bilinear interpolation between pixels
+
+        :param points:    north and east coordinates in centimeters of each position
+        :type points:     list of (float, float) or numpy array (n x 2)
+        :param footprint: diameter of the area to average in centimeters, default is 0 to
+         sample the full resolution mat
+        :type footprint:  float
+        :return:          red, green and blue components of the mat color at each position,
+         0 outside of the mat
+        :rtype:           numpy array (n x 3)
+        """
+
+        points = array(points, dtype = float).reshape(-1, 2)
+        result = zeros((len(points), 3))
+
+        if len(self.__levels) > 0 and len(points) > 0 :
+
+            y = self.__height - points[:,0] / self.__scale
+            x = points[:,1] / self.__scale
+            inside = (0 <= y) & (y < self.__height) & (0 <= x) & (x < self.__width)
+            x = x[inside]
+            y = y[inside]
+
+            level = self.__level(footprint)
+            tiles = self.__levels[level]
+            width, height = self.__sizes[level]
+            if level > 0 :
+                y = ((y - ((1 << level) - 1) * 0.5) / (1 << level)).clip(0)
+                x = ((x - ((1 << level) - 1) * 0.5) / (1 << level)).clip(0)
+
+            # Neighbour pixels, the last row and column being repeated on the mat border
+            x0 = x.astype(int)
+            x1 = x0 + 1
+            xn = minimum(x1, width - 1)
+            y0 = y.astype(int)
+            y1 = y0 + 1
+            yn = minimum(y1, height - 1)
+
+            result[inside] = \
+                self.__pixels(tiles, y0, x0) * ((x1 - x) * (y1 - y))[:,None] + \
+                self.__pixels(tiles, y0, xn) * ((x - x0) * (y1 - y))[:,None] + \
+                self.__pixels(tiles, yn, x0) * ((x1 - x) * (y - y0))[:,None] + \
+                self.__pixels(tiles, yn, xn) * ((x - x0) * (y - y0))[:,None]
+
+        return result
+
 # pylint: enable=R0914
 
+    def __level(self, footprint) :
+        """
+        Pyramid level whose pixels size matches a footprint
+
+        :param footprint: diameter of the area to average in centimeters
+        :type footprint:  float
+        :return:          pyramid level, 0 for the full resolution mat
+        :rtype:           integer
+        """
+
+        result = 0
+        if footprint > self.__scale :
+            result = min(len(self.__levels) - 1, int(floor(log2(footprint / self.__scale))))
+
+        return result
+
+    def __pixels(self, tiles, y, x) :
+        """
+        Read pixels from tiled mat
+
+        :param tiles: tiled pyramid level
+        :type tiles:  numpy array
+        :param y:     pixels rows
+        :type y:      numpy array of integers
+        :param x:     pixels columns
+        :type x:      numpy array of integers
+        :return:      red, green and blue components of each pixel
+        :rtype:       numpy array (n x 3) of integers
+        """
+        return tiles[y // self.s_tile_size, x // self.s_tile_size, \
+                     y % self.s_tile_size, x % self.s_tile_size]
+
+    def __decode(self, filename) :
+        """
+        Decode mat image into the tiles of each pyramid level
+
+        :param filename: mat image path
+        :type filename:  string
+        :return:         tiles of each level, indexed by tile row, tile column, pixel row and
+         pixel column
+        :rtype:          list of numpy arrays (rows x columns x tile size x tile size x 3) of bytes
+        """
+
+        result = []
+
+        with Image.open(filename) as img:
+            pixels = asarray(img.convert("RGB"))
+
+            # self.__mat = Image.new("RGB", img.size, (255, 255, 255))
+            # self.__mat.paste(img, mask=img.split()[3])
+
+        result.append(self.__tile(pixels))
+
+        # Average pixels 2 by 2, duplicating the last row or column for odd sizes
+        pixels = pixels.astype(float)
+        while len(result) < len(self.__sizes) :
+            if pixels.shape[0] % 2 == 1 : pixels = concatenate((pixels, pixels[-1:]), axis = 0)
+            if pixels.shape[1] % 2 == 1 : pixels = concatenate((pixels, pixels[:,-1:]), axis = 1)
+            pixels = 0.25 * (pixels[0::2,0::2] + pixels[1::2,0::2] + \
+                             pixels[0::2,1::2] + pixels[1::2,1::2])
+            result.append(self.__tile(rint(pixels)))
+
+        return result
+
+    def __tile(self, pixels) :
+        """
+        Split image into tiles
+
+        :param pixels: image pixels
+        :type pixels:  numpy array (height x width x 3)
+        :return:       tiles, indexed by tile row, tile column, pixel row and pixel column
+        :rtype:        numpy array (rows x columns x tile size x tile size x 3) of bytes
+        """
+
+        size = self.s_tile_size
+        rows = -(-pixels.shape[0] // size)
+        columns = -(-pixels.shape[1] // size)
+
+        result = zeros((rows * size, columns * size, 3), dtype = uint8)
+        result[:pixels.shape[0], :pixels.shape[1]] = pixels
+
+        result = ascontiguousarray(
+            result.reshape(rows, size, columns, size, 3).transpose(0, 2, 1, 3, 4))
+
+        return result
+
+    def __map(self, filename, directory) :
+        """
+        Memory map mat tiles from the tiles directory, writing them first if needed
+
+        :param filename:  mat image path
+        :type filename:   string
+        :param directory: tiles directory
+        :type directory:  string
+        :return:          read-only tiles of each pyramid level, empty if the tiles directory is
+         not available
+        :rtype:           list of numpy arrays
+        """
+
+        result = []
+
+        if directory is None :
+            self.s_logger.warning('No tiles directory to share mat, mat is loaded in memory')
+        else :
+            key = (ospath.abspath(filename), stat(filename).st_mtime_ns, self.s_tile_size)
+            key = sha1(repr(key).encode('UTF-8')).hexdigest()
+            levels = [ospath.join(directory, key + '.' + str(level) + '.mat.npy') \
+                for level in range(len(self.__sizes))]
+            try :
+                if not all(ospath.isfile(level) for level in levels) :
+                    makedirs(directory, exist_ok = True)
+                    for level, tiles in zip(levels, self.__decode(filename)) :
+                        with open(level + '.' + str(getpid()) + '.tmp', 'wb') as file :
+                            save(file, tiles)
+                            file.close()
+                        replace(level + '.' + str(getpid()) + '.tmp', level)
+                # Plain array view on the mapped file, cheaper to index than a memmap
+                result = [asarray(load(level, mmap_mode = 'r')) for level in levels]
+            except OSError as exc :
+                self.s_logger.warning('Could not share mat, mat is loaded in memory : %s', str(exc))
+                result = []
+
+        return result
+
     def __check_configuration(self, conf) :
         """
         Check input json configuration
@@ -102,12 +360,17 @@ class ScenarioGround() :
         :param conf: configuration file content
         :type conf:  dictionary
 
-        :raises ValueError: missing image or scale information
+        :raises ValueError: missing image or scale information, invalid aperture or tiles
         """
 
         if not 'image' in conf :
             raise ValueError('Missing image for ground')
         if not 'scale' in conf :
             raise ValueError('Missing scale for ground')
+        if 'aperture' in conf and \
+           (not isinstance(conf['aperture'], (int, float)) or not 0 < conf['aperture'] < 90) :
+            raise ValueError('Aperture shall be between 0 and 90 degrees')
+        if 'tiles' in conf and not isinstance(conf['tiles'], str) :
+            raise ValueError('Tiles shall be a directory path')
 
 # pylint enable=C0103
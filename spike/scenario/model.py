@@ -9,13 +9,16 @@
 # -------------------------------------------------------
 
 # System includes
-from json                   import load
-from os                     import path
+from json                   import load, dump
+from os                     import path, makedirs, replace, getpid, remove
+from hashlib                import sha1
+from threading              import Lock
 from logging                import getLogger
+from importlib.metadata     import version, PackageNotFoundError
 
 # wpilib includes
 from wpimath.geometry       import CoordinateSystem, CoordinateAxis, Rotation3d
-from wpimath.geometry       import Pose3d, Transform3d, Translation3d
+from wpimath.geometry       import Pose3d, Transform3d, Translation3d, Quaternion
 
 # numpy includes
 from numpy                  import ndarray, array
@@ -28,15 +31,38 @@ from ldraw.pieces           import Piece
 from spike.scenario.parts   import ScenarioPart, ScenarioPartMotor, ScenarioPartWheel
 from spike.scenario.parts   import ScenarioPartColorSensor, ScenarioPartForceSensor
 from spike.scenario.parts   import ScenarioPartDistanceSensor, ScenarioPartHub
+from spike.scenario.abaqus  import ScenarioAbaqus
 
-# pylint: disable=W0238
+# pylint: disable=W0238, R0902
 class ScenarioModel() :
-    """ Class modelling robot static relative geometry """
+    """ Class modelling robot static relative geometry
+        The robot parts compiled from the configuration are cached in memory for the whole
+        process and on disk as json files, keyed by the content of the robot configuration, ldraw
+        and abaqus files, so that a robot is parsed from its ldraw model only once. The key also
+        covers the compiled model format version and the ldraw library installed, so that a
+        compiled model is parsed again when any of them changes.
+    """
 
     s_topics               = ['design','abaqus','components']
     s_parts_to_connect     = ['Motor', 'ColorSensor', 'DistanceSensor', 'ForceSensor']
     s_ports                = ['A','B','C','D','E','F']
     s_logger               = getLogger('model')
+    s_cache                = {}
+    s_mutex                = Lock()
+    s_cache_version        = 3
+    """ Compiled model format version --- To increase with any change of the parts compilation """
+    s_library_configuration = path.join(path.expanduser('~'), '.config', 'pyldraw', 'config.yml')
+    s_cache_directory      = path.join(path.expanduser('~'), '.cache', 'spike-mock')
+
+    @staticmethod
+    def configure_cache(directory) :
+        """
+        Static method to set the directory in which compiled models are cached on disk
+
+        :param directory: cache directory, None to disable on-disk caching
+        :type directory:  string
+        """
+        ScenarioModel.s_cache_directory = directory
 
     def __init__(self) :
         """ Constructor """
@@ -47,9 +73,16 @@ class ScenarioModel() :
         self.__parts_by_type = {}
         self.__parts_by_port = {}
         self.__model         = None
+        self.__design        = None
+        self.__filename      = None
+
+        # Robot abaqus
+        self.__speed_abaqus  = None
+        self.__radius_abaqus = None
 
         # Global data
         self.__altitude = 0
+        self.__ldu      = 0.04
 
     def configure(self, filename) :
         """
@@ -73,16 +106,29 @@ class ScenarioModel() :
 
         # Open workbook and load sheets
         self.s_logger.info('Loading abaqus')
-        ScenarioPartMotor.configure(path.dirname(filename) + '/' + conf['abaqus'], 'motor-command')
-        ScenarioPartWheel.configure(path.dirname(filename) + '/' + conf['abaqus'], 'wheel-diameter')
-
-        # Load parts from ldraw file
-        self.s_logger.info('Loading ldraw model')
-        parts, self.__model, self.__pieces = self.__read(
-            path.dirname(filename) + '/' + conf['design']['filename'], \
-            conf['design']['ldu'])
-        parts = self.__convert_pose(parts, CoordinateSystem.NED())
-        parts, spins = self.__add_port_to_parts(conf, parts)
+        self.__speed_abaqus = ScenarioAbaqus()
+        self.__speed_abaqus.read(path.dirname(filename) + '/' + conf['abaqus'], 'motor-command')
+        self.__radius_abaqus = ScenarioAbaqus()
+        self.__radius_abaqus.read(path.dirname(filename) + '/' + conf['abaqus'], 'wheel-diameter')
+
+        # Load parts from compiled model cache, or from ldraw file
+        self.__filename = path.dirname(filename) + '/' + conf['design']['filename']
+        self.__ldu      = conf['design']['ldu']
+        self.__design   = None
+        key = self.__key(filename, conf)
+        content = self.__load_cache(key)
+        if content is None :
+            self.s_logger.info('Loading ldraw model')
+            self.__model, self.__pieces = get_model(self.__filename)
+            parts = self.__read(self.__model, self.__ldu)
+            parts = self.__convert_pose(parts, CoordinateSystem.NED())
+            parts, spins = self.__add_port_to_parts(conf, parts)
+            self.__store_cache(key, self.__compile(parts, spins))
+        else :
+            self.s_logger.info('Loading compiled model from cache')
+            parts, spins = self.__decompile(content)
+            self.__model  = None
+            self.__pieces = None
         self.__parts, self.__parts_by_type, self.__parts_by_port = \
             self.__organize_parts(parts, spins)
 
@@ -151,6 +197,26 @@ class ScenarioModel() :
         """
         return self.__parts
 
+    def design(self) :
+        """
+        Returns all the pieces of the robot ldraw model, including the passive ones, with their
+        NED pose. The pieces are only built on first call, since the robot dynamics only needs the
+        active or sensive parts
+
+        :return: robot pieces
+        :rtype:  list
+        """
+
+        if self.__design is None and self.__filename is not None :
+            if self.__model is None :
+                self.__model, self.__pieces = get_model(self.__filename)
+            self.__design = self.__convert_pose(
+                self.__read(self.__model, self.__ldu, False), CoordinateSystem.NED())
+
+        result = self.__design
+        if result is None : result = []
+        return result
+
     def __check_configuration(self, conf) :
         """
         Check input json configuration
@@ -183,28 +249,36 @@ class ScenarioModel() :
             elif not key in self.s_topics :
                 raise ValueError('Unknown topic ' + key + ' in robot configuration')
 
-    def __read(self, filename, ldu=0.04) :
+    def __read(self, model, ldu=0.04, active=True) :
         """
-        Build robot model from ldraw file
-
-        :param filename: ldraw formatted filename path
-        :type filename:  string
-        :param ldu:      ldu (ldraw unit) size in centimeters, default 0.4 mm
-        :type ldu:       float
-        :return:         robot parts, robot model, ldraw parts
-        :rtype:          list, list, dictionary
+        Build robot parts from ldraw model. Pieces are classified from their identifier first,
+        so that the geometry is only built for the pieces to keep
+
+        :param model:  ldraw model
+        :type model:   ldraw Model
+        :param ldu:    ldu (ldraw unit) size in centimeters, default 0.4 mm
+        :type ldu:     float
+        :param active: True (default) to keep only the parts with a known type, False for all
+        :type active:  boolean
+        :return:       robot parts
+        :rtype:        list
         """
 
         result = []
 
-        model, pieces = get_model(filename)
         for obj in model.objects:
             if not isinstance(obj, Piece):
                 continue
 
+            typ = self.__classify(obj.part)
+            if active and typ == '' :
+                continue
+
             part = ScenarioPart()
             part.id = obj.part
-            part.color = obj.colour
+            part.type = typ
+            # Colour code rather than pyldraw colour object, to be stored in cache
+            part.color = getattr(obj.colour, 'code', obj.colour)
             rotation     = ndarray((3,3), buffer=array([
                 round(obj.matrix.rows[0][0],5), round(obj.matrix.rows[0][1],5),
                 round(obj.matrix.rows[0][2],5), round(obj.matrix.rows[1][0],5),
@@ -217,17 +291,29 @@ class ScenarioModel() :
                 Translation3d(-obj.position.x * ldu, obj.position.y * ldu, -obj.position.z * ldu),
                 Rotation3d(rotation))
 
-            part.type = ''
-            if part.id in ScenarioPartWheel.s_ids             : part.type = 'Wheel'
-            elif part.id in ScenarioPartColorSensor.s_ids     : part.type = 'ColorSensor'
-            elif part.id in ScenarioPartDistanceSensor.s_ids  : part.type = 'DistanceSensor'
-            elif part.id in ScenarioPartForceSensor.s_ids     : part.type = 'ForceSensor'
-            elif part.id in ScenarioPartMotor.s_ids           : part.type = 'Motor'
-            elif part.id in ScenarioPartHub.s_ids             : part.type = 'Hub'
-
             result.append(part)
 
-        return result, model, pieces
+        return result
+
+    @staticmethod
+    def __classify(identifier) :
+        """
+        Derive part type from its ldraw identifier
+
+        :param identifier: ldraw part identifier
+        :type identifier:  string
+        :return:           part type, empty if the part is neither active nor sensive
+        :rtype:            string
+        """
+
+        result = ''
+        if identifier in ScenarioPartWheel.s_ids             : result = 'Wheel'
+        elif identifier in ScenarioPartColorSensor.s_ids     : result = 'ColorSensor'
+        elif identifier in ScenarioPartDistanceSensor.s_ids  : result = 'DistanceSensor'
+        elif identifier in ScenarioPartForceSensor.s_ids     : result = 'ForceSensor'
+        elif identifier in ScenarioPartMotor.s_ids           : result = 'Motor'
+        elif identifier in ScenarioPartHub.s_ids             : result = 'Hub'
+        return result
 
     def __convert_pose(self, parts, system) :
         """
@@ -244,19 +330,19 @@ class ScenarioModel() :
         result = []
 
         ldraw_axis = CoordinateSystem(CoordinateAxis.E(), CoordinateAxis.D(), CoordinateAxis.N())
+        # transformation from ldraw to ned, the same for all parts
+        transformation = Transform3d(
+            Translation3d(),
+            CoordinateSystem.convert(Rotation3d(), ldraw_axis, system) * (-1.0))
         for part in parts :
             # Rotation to go from ned rotated reference to ldraw straight
             pose = CoordinateSystem.convert( part.pose, ldraw_axis, system)
-            # transformation from ldraw to ned
-            transformation = Transform3d(
-                Translation3d(),
-                CoordinateSystem.convert(Rotation3d(), ldraw_axis, system) * (-1.0))
             # Rotation to go from ned straight to ned rotated reference
             pose = pose.transformBy(transformation)
             if part.type != '' :
                 self.s_logger.debug(
                     'type : %s - Initial pose : %s - NED pose : %s',
-                    part.type, str(part.pose), str(pose))
+                    part.type, part.pose, pose)
             part.pose = pose
             result.append(part)
 
@@ -289,6 +375,12 @@ class ScenarioModel() :
                     if comp['index'] == i_part :
                         selected_part = part
                     i_part += 1
+            # Pieces with unknown type are not loaded : look for them in the ldraw model
+            if selected_part is None and self.__classify(comp['id']) == '' :
+                i_part = len([obj for obj in self.__model.objects \
+                    if isinstance(obj, Piece) and obj.part == comp['id']])
+                if comp['index'] < i_part :
+                    raise ValueError('Expected type does not match the part one')
             if selected_part is None and i_part == 0 :
                 raise ValueError('Component not found in port ' + comp['port'])
             if selected_part is None and i_part != 0 :
@@ -340,7 +432,8 @@ class ScenarioModel() :
         for part in parts :
 
             typed_part = None
-            if   part.type == 'Motor'           : typed_part = ScenarioPartMotor(part)
+            if   part.type == 'Motor'           :
+                typed_part = ScenarioPartMotor(part, self.__speed_abaqus)
             elif part.type == 'ColorSensor'     : typed_part = ScenarioPartColorSensor(part)
             elif part.type == 'ForceSensor'     : typed_part = ScenarioPartForceSensor(part)
             elif part.type == 'DistanceSensor'  : typed_part = ScenarioPartDistanceSensor(part)
@@ -364,8 +457,8 @@ class ScenarioModel() :
                     if not part.port in wheels : wheels[part.port] = []
                     for part2 in result_by_port[part.port] :
                         if part2.type == 'Motor' :
-                            typed_part = ScenarioPartWheel(\
-                                part, part2, spins[part.port][len(wheels[part.port])])
+                            typed_part = ScenarioPartWheel(part, part2, \
+                                spins[part.port][len(wheels[part.port])], self.__radius_abaqus)
                             wheels[part.port].append(typed_part)
                             part2.wheel = typed_part
 
@@ -385,5 +478,169 @@ class ScenarioModel() :
 
         return all_parts, result_by_type, result_by_port
 
+    def __key(self, filename, conf) :
+        """
+        Compiled model cache key : hash of the compiled model format version, the ldraw library
+        version and configuration, and the robot configuration, ldraw and abaqus files content
+
+        :param filename: Robot configuration file path
+        :type filename:  string
+        :param conf:     Robot configuration file content
+        :type conf:      dictionary
+        :return:         cache key
+        :rtype:          string
+        """
+
+        result = sha1()
+
+        library = 'unknown'
+        try :
+            library = version('pyldraw')
+        except PackageNotFoundError :
+            pass
+        result.update(('version ' + str(self.s_cache_version) + ' pyldraw ' + library) \
+            .encode('UTF-8'))
+        if path.isfile(self.s_library_configuration) :
+            with open(self.s_library_configuration, 'rb') as file :
+                result.update(file.read())
+                file.close()
+
+        for name in [filename, \
+                     path.dirname(filename) + '/' + conf['design']['filename'], \
+                     path.dirname(filename) + '/' + conf['abaqus']] :
+            with open(name, 'rb') as file :
+                result.update(file.read())
+                file.close()
+
+        return result.hexdigest()
+
+    def __load_cache(self, key) :
+        """
+        Load a compiled model from memory or on-disk cache. Unreadable cache files and cache
+        files from another format version are removed
+
+        :param key: compiled model cache key
+        :type key:  string
+        :return:    compiled model, None if not cached
+        :rtype:     dictionary
+        """
+
+        with self.s_mutex :
+            result = self.s_cache.get(key)
+
+        directory = self.s_cache_directory
+        filename = None
+        if directory is not None : filename = path.join(directory, key + '.model.json')
+        if result is None and filename is not None and path.isfile(filename) :
+            discard = False
+# pylint: disable=W0703
+            try :
+                with open(filename, 'r', encoding='UTF-8') as file :
+                    result = load(file)
+                    file.close()
+                if not isinstance(result, dict) : raise ValueError('Not a compiled model')
+            except Exception as exc :
+                self.s_logger.warning('Discarding unreadable model cache : %s', str(exc))
+                result = None
+                discard = True
+# pylint: enable=W0703
+            if result is not None and result.get('version') != self.s_cache_version :
+                self.s_logger.warning('Discarding model cache from another format version')
+                result = None
+                discard = True
+            if discard :
+                try :
+                    remove(filename)
+                except OSError :
+                    pass
+            if result is not None :
+                with self.s_mutex : self.s_cache[key] = result
+
+        return result
+
+    def __store_cache(self, key, content) :
+        """
+        Store a compiled model in memory and on-disk cache
+
+        :param key:     compiled model cache key
+        :type key:      string
+        :param content: compiled model
+        :type content:  dictionary
+        """
+
+        with self.s_mutex :
+            self.s_cache[key] = content
+
+        directory = self.s_cache_directory
+        if directory is not None :
+            filename = path.join(directory, key + '.model.json')
+            try :
+                makedirs(directory, exist_ok = True)
+                with open(filename + '.' + str(getpid()) + '.tmp', 'w', encoding='UTF-8') as file :
+                    dump(content, file)
+                    file.close()
+                replace(filename + '.' + str(getpid()) + '.tmp', filename)
+            except (OSError, TypeError, ValueError) as exc :
+                self.s_logger.warning('Could not write model cache : %s', str(exc))
+
+    @staticmethod
+    def __compile(parts, spins) :
+        """
+        Convert connected parts into serializable data
+
+        :param parts: connected robot parts, with their NED pose
+        :type parts:  list
+        :param spins: wheel spins by port
+        :type spins:  dictionary
+        :return:      compiled model
+        :rtype:       dictionary
+        """
+
+        result = { 'version' : ScenarioModel.s_cache_version, 'parts' : [], 'spins' : spins }
+
+        for part in parts :
+            translation = part.pose.translation()
+            quaternion = part.pose.rotation().getQuaternion()
+            result['parts'].append({
+                'id'    : part.id,
+                'color' : part.color,
+                'type'  : part.type,
+                'port'  : part.port,
+                'pose'  : [translation.x, translation.y, translation.z, \
+                           quaternion.W(), quaternion.X(), quaternion.Y(), quaternion.Z()]
+            })
+
+        return result
+
+    @staticmethod
+    def __decompile(content) :
+        """
+        Rebuild connected parts from serialized data
+
+        :param content: compiled model
+        :type content:  dictionary
+        :return:        parts, wheel spins
+        :rtype:         tuple (list, dictionary)
+        """
+
+        result = []
+
+        for data in content['parts'] :
+            part = ScenarioPart()
+            part.id     = data['id']
+            part.color  = data['color']
+            part.type   = data['type']
+            part.port   = data['port']
+            part.pose   = Pose3d(
+                Translation3d(data['pose'][0], data['pose'][1], data['pose'][2]),
+                Rotation3d(Quaternion(data['pose'][3], data['pose'][4], \
+                                      data['pose'][5], data['pose'][6])))
+            result.append(part)
+
+        spins = {}
+        for port, values in content['spins'].items() : spins[port] = list(values)
+
+        return result, spins
+
 
-# pylint: enable=W0238
+# pylint: enable=W0238, R0902
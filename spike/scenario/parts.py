@@ -15,15 +15,58 @@ from math                   import copysign, fabs, cos, sin, pi
 from logging                import getLogger
 
 # wpilib includes
-from wpimath.geometry       import Translation3d, Rotation3d, Pose3d
+from wpimath.geometry       import Translation3d, Rotation3d, Pose3d, Quaternion
+
+# numpy includes
+from numpy                  import array
 
 # Local includes
 from spike.scenario.abaqus  import ScenarioAbaqus
+from spike.scenario.trace   import ScenarioTrace
 
 # pylint: disable=R0902, C0103
 class ScenarioPart() :
-    """ Class gathering data on a robot part """
+    """ Class gathering data on a robot part
+        The part absolute pose is stored as numpy arrays, so that it can be updated at low cost
+        along the scenario. The wpimath pose is only built when requested.
+        A part following the robot center derives its absolute pose from the center pose only
+        when it is read, and keeps it until the robot center moves.
+    """
     s_logger        = getLogger('parts')
+    s_trace         = ScenarioTrace('parts')
+
+    @staticmethod
+    def to_arrays(pose) :
+        """
+        Static method to convert a pose into numpy arrays
+
+        :param pose: pose to convert
+        :type pose:  Pose3d
+        :return:     translation and rotation quaternion
+        :rtype:      tuple (numpy array (3), numpy array (4) [w, x, y, z])
+        """
+
+        translation = pose.translation()
+        quaternion = pose.rotation().getQuaternion()
+
+        return array([translation.x, translation.y, translation.z]), \
+               array([quaternion.W(), quaternion.X(), quaternion.Y(), quaternion.Z()])
+
+    @staticmethod
+    def to_pose(translation, rotation) :
+        """
+        Static method to convert numpy arrays into a pose
+
+        :param translation: translation
+        :type translation:  numpy array (3)
+        :param rotation:    rotation quaternion
+        :type rotation:     numpy array (4) [w, x, y, z]
+        :return:            pose
+        :rtype:             Pose3d
+        """
+        return Pose3d(
+            Translation3d(*translation.tolist()),
+            Rotation3d(Quaternion(*rotation.tolist())))
 
     def __init__(self, copy=None) :
         """ Constructor
@@ -33,18 +76,25 @@ class ScenarioPart() :
 
         """
 
+        self.__pose        = None
+        self.__location    = None
+        self.__relative    = None
+        self.__offset      = None
+        self.__center      = None
+        self.__placement   = None
+
         if copy is None :
             self.__type     = ''
             self.__id       = None
-            self.__pose     = Pose3d(Translation3d(),Rotation3d())
-            self.__relative = Pose3d(Translation3d(),Rotation3d())
+            self.pose       = Pose3d(Translation3d(),Rotation3d())
+            self.relative   = Pose3d(Translation3d(),Rotation3d())
             self.__color    = -1
             self.__port     = None
         else :
             self.__type     = copy.type
             self.__id       = copy.id
-            self.__pose     = copy.pose
-            self.__relative = copy.relative
+            self.pose       = copy.pose
+            self.relative   = copy.relative
             self.__color    = copy.color
             self.__port     = copy.port
 
@@ -91,16 +141,50 @@ class ScenarioPart() :
         :return: part absolute pose
         :rtype:  Pose3d
         """
-        return self.__pose
+        location = self.location()
+        pose = self.__pose
+        if pose is None or pose[0] is not location :
+            pose = (location, self.to_pose(*location))
+            self.__pose = pose
+        return pose[1]
     @pose.setter
     def pose(self, value):
         """
-        Part 3d absolute pose setter
+        Part 3d absolute pose setter - The part stops following the robot center
 
         :param value: part 3d pose
         :type value:  Pose3d
         """
-        self.__pose = value
+        location = self.to_arrays(value)
+        self.__center = None
+        self.__location = location
+        self.__pose = (location, value)
+
+    def follow(self, center) :
+        """
+        Make the part absolute pose follow the robot center, using the part relative pose
+
+        :param center: robot center record, whose location is updated each time the robot moves
+        :type center:  dictionary {'location' : (north, east, down, yaw)}
+        """
+        self.__placement = None
+        self.__center = center
+
+    def location(self) :
+        """
+        Part 3d absolute pose getter as numpy arrays, derived from the robot center if the
+        robot moved since the last call
+
+        :return: part translation and rotation quaternion
+        :rtype:  tuple (numpy array (3), numpy array (4) [w, x, y, z])
+        """
+        center = self.__center
+        if center is not None :
+            placement = center['location']
+            if placement is not None and placement is not self.__placement :
+                self.__location = self.__place(placement)
+                self.__placement = placement
+        return self.__location
 
     @property
     def relative(self) :
@@ -119,6 +203,8 @@ class ScenarioPart() :
         :type value:  Pose3d
         """
         self.__relative = value
+        translation, rotation = self.to_arrays(value)
+        self.__offset = (translation.tolist(), rotation.tolist())
 
     @property
     def port(self) :
@@ -194,6 +280,30 @@ class ScenarioPart() :
         result['pose'] = self.pose
         return result
 
+    def __place(self, placement) :
+        """ Derive part absolute pose from the robot center one, the part rotation quaternion
+        being composed with the robot yaw one the same way as wpimath Rotation3d.rotateBy """
+
+        north, east, down, yaw = placement
+        translation, rotation = self.__offset
+
+        cos_yaw = cos(yaw)
+        sin_yaw = sin(yaw)
+        translation = array([
+            north + cos_yaw * translation[0] - sin_yaw * translation[1],
+            east + sin_yaw * translation[0] + cos_yaw * translation[1],
+            down + translation[2]])
+
+        cos_yaw = cos(yaw / 2)
+        sin_yaw = sin(yaw / 2)
+        rotation = array([
+            cos_yaw * rotation[0] - sin_yaw * rotation[3],
+            cos_yaw * rotation[1] - sin_yaw * rotation[2],
+            cos_yaw * rotation[2] + sin_yaw * rotation[1],
+            cos_yaw * rotation[3] + sin_yaw * rotation[0]])
+
+        return translation, rotation
+
     def derive_relative(self, center) :
         """
         Compute part pose relative to the robot center pose
@@ -210,7 +320,7 @@ class ScenarioPart() :
         )
         self.s_logger.debug(
             'type : %s - NED absolute pose : %s - Center relative pose : %s',
-            self.type, str(self.pose), str(self.relative))
+            self.type, self.pose, self.relative)
 
     def derive_pose(self, center) :
         """
@@ -224,13 +334,16 @@ class ScenarioPart() :
             center.translation() + self.relative.translation().rotateBy(center.rotation()),
             self.relative.rotation().rotateBy(center.rotation())
         )
-        self.s_logger.debug(
+        self.s_trace.trace(
             'type : %s - Center relative pose : %s - NED absolute pose : %s',
-            self.type, str(self.relative), str(self.pose))
+            self.type, self.relative, self.pose)
 # pylint: enable=R0902, C0103
 
 class ScenarioPartMotor(ScenarioPart) :
-    """ Class defining motor dynamics part """
+    """ Class defining motor dynamics part
+        Motors use the speed abaqus of their robot model, or the process-wide one loaded by
+        configure if none is given
+    """
 
     # Static variables
     s_speed_abaqus  = ScenarioAbaqus()
@@ -249,12 +362,14 @@ class ScenarioPartMotor(ScenarioPart) :
         ScenarioPartMotor.s_logger.info('loading speed abaqus')
         ScenarioPartMotor.s_speed_abaqus.read(filename, sheet)
 
-    def __init__(self, part) :
+    def __init__(self, part, abaqus = None) :
         """
         Motor constructor
 
-        :param part : part to set as motor
-        :type part  : ScenarioPart object
+        :param part :   part to set as motor
+        :type part  :   ScenarioPart object
+        :param abaqus : speed abaqus, default is None to use the process-wide one
+        :type abaqus :  ScenarioAbaqus
 
         :raises ValueError: part is not a known motor
         """
@@ -263,6 +378,7 @@ class ScenarioPartMotor(ScenarioPart) :
             raise ValueError('Part ' + str(part.id) + ' is not a known motor')
 
         super().__init__(part)
+        if abaqus is not None : self.s_speed_abaqus = abaqus
         self.__wheel     = None
         self.__speed     = 0
         self.__degrees   = 0
@@ -432,7 +548,10 @@ class ScenarioPartMotor(ScenarioPart) :
         self.__degrees += self.__speed * delta
 
 class ScenarioPartWheel(ScenarioPart) :
-    """ Class defining wheel dynamics """
+    """ Class defining wheel dynamics
+        Wheels use the diameter abaqus of their robot model, or the process-wide one loaded by
+        configure if none is given
+    """
 
     s_wheel_radius_abaqus  = ScenarioAbaqus()
     s_ids                  = ['39367PB01','49295C01','32020C01']
@@ -451,16 +570,18 @@ class ScenarioPartWheel(ScenarioPart) :
         ScenarioPartWheel.s_logger.info('loading wheel radius abaqus')
         ScenarioPartWheel.s_wheel_radius_abaqus.read(filename, sheet)
 
-    def __init__(self, part, motor, spin) :
+    def __init__(self, part, motor, spin, abaqus = None) :
         """
         Constructor
 
-        :param part: part to set as sheel
-        :type part:  ScenarioPart
-        :param part: motor associated to the wheel
-        :type part:  ScenarioPartMotor
-        :param spin: 1 if the wheel rotates in the same direction as its motor
+        :param part:   part to set as sheel
+        :type part:    ScenarioPart
+        :param part:   motor associated to the wheel
+        :type part:    ScenarioPartMotor
+        :param spin:   1 if the wheel rotates in the same direction as its motor
          (even number of gears), -1 otherwise (odd number of gears)
+        :param abaqus: wheel diameter abaqus, default is None to use the process-wide one
+        :type abaqus:  ScenarioAbaqus
 
         :raises ValueError: part is not a known wheel
         """
@@ -469,6 +590,7 @@ class ScenarioPartWheel(ScenarioPart) :
             raise ValueError('Part ' + str(part.id) + ' is not a known wheel')
 
         super().__init__(part)
+        if abaqus is not None : self.s_wheel_radius_abaqus = abaqus
 
         self.__motor       = motor
         self.type          = 'Wheel'
@@ -625,6 +747,15 @@ class ScenarioPartColorSensor(ScenarioPart) :
         result['blue'] = self.__blue
         return result
 
+    @property
+    def rgb(self) :
+        """ Last color read getter
+
+        :return: red, green and blue components of the last color read
+        :rtype:  tuple (float [0,255], float [0,255], float [0,255])
+        """
+        return (self.__red, self.__green, self.__blue)
+
     def read_color(self, mat) :
         """
         Read color at sensor position on mat
@@ -635,21 +766,24 @@ class ScenarioPartColorSensor(ScenarioPart) :
 
         self.__red = self.__green = self.__blue = 0
 
-        # Project the color sensor orientation on the mat
-        north = self.pose.translation().X()
-        east  = self.pose.translation().Y()
-        down  = self.pose.translation().Z()
+        # Project the color sensor orientation on the mat : the sensor aims along the direction
+        # (cos pitch cos yaw, cos pitch sin yaw, + sin pitch) in north, east, down coordinates,
+        # the down component being positive when the sensor looks toward the mat
+        translation, rotation = self.location()
+        north, east, down = translation.tolist()
+        rotation = rotation.tolist()
 
-        vecn = cos(self.pose.rotation().Y()) * cos(self.pose.rotation().Z())
-        vece = cos(self.pose.rotation().Y()) * sin(self.pose.rotation().Z())
-        vecd = sin(self.pose.rotation().Y())
+        vecn = 1 - 2 * (rotation[2] * rotation[2] + rotation[3] * rotation[3])
+        vece = 2 * (rotation[1] * rotation[2] + rotation[0] * rotation[3])
+        vecd = 2 * (rotation[0] * rotation[2] - rotation[1] * rotation[3])
 
         if vecd > 0 :
             t_inter = -down / vecd
             north = north + t_inter * vecn
             east = east  + t_inter * vece
 
-            color = mat.get_color(north, east)
+            # The sensor sees a larger mat area as it moves away from the mat
+            color = mat.get_color(north, east, mat.footprint(t_inter))
             if color is not None:
                 self.__red = color['red']
                 self.__green = color['green']
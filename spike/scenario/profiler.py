@@ -0,0 +1,191 @@
+# -------------------------------------------------------
+# Copyright (c) [2022] Nadege LEMPERIERE
+# All rights reserved
+# -------------------------------------------------------
+""" Scenario steps timing instrumentation """
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @04 november 2022
+# Latest revision: 04 november 2022
+# -------------------------------------------------------
+
+# System includes
+from time       import perf_counter
+from math       import sqrt
+from bisect     import bisect_right
+from json       import dump
+from threading  import Lock
+from logging    import getLogger
+
+# pylint: disable=R0902
+class ScenarioProfiler() :
+    """ Class measuring the duration of each scenario step and of its phases
+        Durations are accumulated in histograms with fixed bins, from 1 microsecond to 1 second
+        following a 1-2-5 progression, so that profiling a long scenario uses a constant memory.
+        The measured phases are :
+
+        - components : software components update, and scenario observers
+        - extrapolation : robot motion and motors update by the dynamics
+        - colors : color sensors sampling on the mat by the dynamics
+        - commands : pending commands processing
+        - notification : release of the threads waiting for the step
+        - tick : whole step processing
+
+        In realtime mode, the interval between consecutive steps is also measured. A step misses
+        its deadline if its processing, or in realtime mode the interval since the previous step,
+        exceeds the scenario update period.
+    """
+
+    s_logger = getLogger('scenario')
+    s_phases = ['components', 'extrapolation', 'colors', 'commands', 'notification', 'tick',
+                'interval']
+    s_bins   = [mantissa * 10 ** exponent for exponent in range(0, 6) for mantissa in [1, 2, 5]] \
+             + [1000000]
+    """ Histograms bins upper bounds in microseconds, the last bin gathering longer durations """
+
+    def __init__(self) :
+        """ Constructor """
+
+        self.__mutex        = Lock()
+        self.__histograms   = {}
+        self.__statistics   = {}
+        self.__missed       = 0
+        self.__budget       = 0
+        self.__previous     = None
+        self.__interval     = 0
+        self.__lap          = 0
+        self.__start        = 0
+        self.__nested       = 0
+        self.reset()
+
+    def reset(self) :
+        """ Forget all measurements """
+        with self.__mutex :
+            for phase in self.s_phases :
+                self.__histograms[phase] = [0] * (len(self.s_bins) + 1)
+                self.__statistics[phase] = { 'count' : 0, 'sum' : 0, 'squares' : 0, 'max' : 0 }
+            self.__missed   = 0
+            self.__previous = None
+
+    def start(self, budget, realtime) :
+        """
+        Start measuring a scenario step - Called by the scenario thread
+
+        :param budget:   maximum duration of a step
+        :type budget:    float (seconds)
+        :param realtime: True if the scenario runs in realtime mode, False otherwise
+        :type realtime:  boolean
+        """
+
+        now = perf_counter()
+        self.__budget   = budget
+        self.__interval = 0
+        if realtime and self.__previous is not None :
+            self.__interval = now - self.__previous
+            self.record('interval', self.__interval)
+        self.__previous = now
+        self.__start    = now
+        self.__lap      = now
+        self.__nested   = 0
+
+    def lap(self, phase) :
+        """
+        Record the duration of a step phase, from the end of the previous phase - Called by the
+        scenario thread. The durations of the nested phases recorded in between are excluded
+
+        :param phase: name of the phase which ended
+        :type phase:  string
+        """
+
+        now = perf_counter()
+        nested = self.__nested
+        self.record(phase, now - self.__lap - nested)
+        self.__nested = 0
+        self.__lap = now
+
+    def record(self, phase, duration) :
+        """
+        Record the duration of a step phase - Called by the scenario thread
+        Phases measured inside another phase are excluded from it at its next lap
+
+        :param phase:    name of the phase
+        :type phase:     string
+        :param duration: phase duration
+        :type duration:  float (seconds)
+        """
+
+        microseconds = duration * 1e6
+        with self.__mutex :
+            self.__histograms[phase][bisect_right(self.s_bins, microseconds)] += 1
+            statistics = self.__statistics[phase]
+            statistics['count'] += 1
+            statistics['sum'] += microseconds
+            statistics['squares'] += microseconds * microseconds
+            statistics['max'] = max(statistics['max'], microseconds)
+        if phase not in ['tick', 'interval'] and self.__lap > 0 :
+            self.__nested += duration
+
+    def stop(self) :
+        """ Stop measuring a scenario step - Called by the scenario thread """
+        self.__lap = 0
+        duration = perf_counter() - self.__start
+        self.record('tick', duration)
+        if duration > self.__budget or self.__interval > self.__budget :
+            with self.__mutex :
+                self.__missed += 1
+
+    def report(self) :
+        """
+        Measurements summary
+
+        :return: for each phase, the number of measurements, the mean, standard deviation and
+         maximum duration in microseconds and the histogram counts by bin upper bound, the last
+         count gathering the longer durations, then the number of missed deadlines
+        :rtype:  dictionary
+        """
+
+        result = { 'bins' : list(self.s_bins), 'phases' : {} }
+
+        with self.__mutex :
+            for phase in self.s_phases :
+                statistics = self.__statistics[phase]
+                count = statistics['count']
+                mean = 0
+                deviation = 0
+                if count > 0 :
+                    mean = statistics['sum'] / count
+                    deviation = sqrt(max(statistics['squares'] / count - mean * mean, 0))
+                result['phases'][phase] = {
+                    'count'     : count,
+                    'mean'      : mean,
+                    'deviation' : deviation,
+                    'max'       : statistics['max'],
+                    'histogram' : list(self.__histograms[phase])
+                }
+            result['missed'] = self.__missed
+            result['budget'] = self.__budget * 1e6
+
+        return result
+
+    def dump(self, filename = None) :
+        """
+        Log the measurements summary, and write it into a json file
+
+        :param filename: path to the json file, default is None to only log the summary
+        :type filename:  string
+        """
+
+        report = self.report()
+        for phase, statistics in report['phases'].items() :
+            if statistics['count'] > 0 :
+                self.s_logger.info('%s : %d steps - mean %.1f us - deviation %.1f us - max %.1f us',
+                    phase, statistics['count'], statistics['mean'], statistics['deviation'],
+                    statistics['max'])
+        self.s_logger.info('%d missed deadlines for a %.0f us budget',
+            report['missed'], report['budget'])
+
+        if filename is not None :
+            with open(filename, 'w', encoding='UTF-8') as file :
+                dump(report, file, indent = 4)
+                file.close()
+
+# pylint: enable=R0902
@@ -0,0 +1,269 @@
+# -------------------------------------------------------
+# Copyright (c) [2022] Nadege LEMPERIERE
+# All rights reserved
+# -------------------------------------------------------
+""" Robot state history recording """
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @04 november 2022
+# Latest revision: 04 november 2022
+# -------------------------------------------------------
+
+# System includes
+from os         import path
+from csv        import writer
+from threading  import Lock
+from logging    import getLogger
+
+# Numpy includes
+from numpy      import zeros, full, concatenate, savez, array
+
+# Local includes
+from spike.scenario.workbook    import ScenarioWorkbook
+from spike.scenario.components  import ScenarioComponents
+
+class ScenarioRecorder() :
+    """ Class recording the robot state at each scenario step
+        Samples are written in a ring buffer preallocated for the recorder capacity, holding a
+        row per step and a column per recorded value : time, robot position, yaw, pitch and roll,
+        then motors degrees and speed and color sensors red, green and blue components, port by
+        port. Once the buffer is full, the oldest samples are overwritten, so that recording never
+        allocates memory along the scenario. A warning is logged when the first sample is
+        overwritten, and the number of overwritten samples is given by the dropped function.
+    """
+
+    s_logger   = getLogger('scenario')
+    s_capacity = 65536
+    """ Default number of samples kept --- Around 11 minutes of scenario at 100Hz """
+
+    def __init__(self, motors, sensors, capacity = None) :
+        """ Constructor
+
+        :param motors:   ports of the motors to record
+        :type motors:    list of strings
+        :param sensors:  ports of the color sensors to record
+        :type sensors:   list of strings
+        :param capacity: maximum number of samples kept, default is None for s_capacity
+        :type capacity:  integer
+
+        :raises ValueError: capacity is not strictly positive
+        """
+
+        if capacity is None : capacity = self.s_capacity
+        if capacity <= 0 :
+            raise ValueError('Recorder capacity shall be strictly positive')
+
+        self.__motors   = list(motors)
+        self.__sensors  = list(sensors)
+        self.__columns  = ['time', 'north', 'east', 'yaw', 'pitch', 'roll']
+        for port in self.__motors :
+            self.__columns.extend([port + '_degrees', port + '_speed'])
+        for port in self.__sensors :
+            self.__columns.extend([port + '_red', port + '_green', port + '_blue'])
+
+        self.__buffer   = zeros((capacity, len(self.__columns)))
+        self.__count    = 0
+        self.__mutex    = Lock()
+
+    def reset(self) :
+        """ Forget all recorded samples """
+        with self.__mutex :
+            self.__count = 0
+
+    def columns(self) :
+        """ Recorded values names
+
+        :return: the name of each column of the recorded samples
+        :rtype:  list of strings
+        """
+        return list(self.__columns)
+
+    def capacity(self) :
+        """ Recorder capacity
+
+        :return: maximum number of samples kept
+        :rtype:  integer
+        """
+        return self.__buffer.shape[0]
+
+    def dropped(self) :
+        """ Number of samples lost since the buffer is full
+
+        :return: number of oldest samples overwritten by newer ones, 0 if all the recorded
+         samples are kept
+        :rtype:  integer
+        """
+        with self.__mutex :
+            result = max(self.__count - self.__buffer.shape[0], 0)
+        return result
+
+    def size(self) :
+        """ Number of samples kept
+
+        :return: number of samples that can be read
+        :rtype:  integer
+        """
+        with self.__mutex :
+            result = min(self.__count, self.__buffer.shape[0])
+        return result
+
+    def record(self, time, dynamics) :
+        """
+        Append the robot state to the recorded samples - Called by the scenario thread
+        after each step, as a scenario observer
+
+        :param time:     step date
+        :type time:      float (seconds)
+        :param dynamics: robot dynamics, whose measurements accessors give the robot state
+        :type dynamics:  ScenarioDynamics
+        """
+
+        values = [time]
+        values.extend(dynamics.position())
+        values.extend(dynamics.orientation())
+        for port in self.__motors :
+            values.append(dynamics.degrees(port))
+            values.append(dynamics.speed(port))
+        for port in self.__sensors :
+            values.extend(dynamics.color(port))
+
+        with self.__mutex :
+            self.__buffer[self.__count % self.__buffer.shape[0]] = values
+            self.__count += 1
+            wrapped = self.__count == self.__buffer.shape[0] + 1
+
+        if wrapped :
+            self.s_logger.warning('Recorder capacity of %d samples reached at %f : the oldest '
+                'samples are overwritten', self.__buffer.shape[0], time)
+
+    def views(self) :
+        """ Recorded samples, without copy
+        The samples are given as read-only views of the ring buffer, in chronological order :
+        a single view until the buffer is full, then the oldest and the newest parts of the
+        buffer. The views content is only stable once the scenario is stopped, the oldest samples
+        being overwritten as new samples are recorded
+
+        :return: views of the recorded samples, one row per step and one column per value
+        :rtype:  list of numpy arrays
+        """
+
+        result = []
+
+        with self.__mutex :
+            capacity = self.__buffer.shape[0]
+            index = self.__count % capacity
+            if self.__count <= capacity :
+                result = [self.__buffer[:self.__count]]
+            else :
+                result = [self.__buffer[index:], self.__buffer[:index]]
+
+        for view in result :
+            view.flags.writeable = False
+
+        return result
+
+    def data(self) :
+        """ Recorded samples, copied only if the ring buffer wrapped around
+        A warning is logged if the oldest samples were overwritten
+
+        :return: recorded samples in chronological order, one row per step and one column
+         per value
+        :rtype:  numpy array
+        """
+
+        result = None
+
+        views = self.views()
+        if self.dropped() > 0 :
+            self.s_logger.warning('Recorded samples start after %d overwritten samples',
+                self.dropped())
+        if len(views) == 1 : result = views[0]
+        else : result = concatenate(views)
+
+        return result
+
+    def column(self, name) :
+        """ Recorded samples of a value
+
+        :param name: value name, as given by the columns function
+        :type name:  string
+
+        :raises ValueError: unknown column
+
+        :return: the value along the recorded steps in chronological order
+        :rtype:  numpy array
+        """
+
+        if not name in self.__columns :
+            raise ValueError('Unknown recorded value ' + name)
+
+        return self.data()[:, self.__columns.index(name)]
+
+    def save(self, filename) :
+        """ Export recorded samples
+
+        :param filename: path to the export file, its extension gives the format : numpy
+         archive with an array per column, and the number of overwritten samples in the
+         'dropped' array, or csv file with a column per value
+        :type filename:  string (.npz or .csv)
+
+        :raises ValueError: unsupported export format
+        """
+
+        extension = path.splitext(filename)[1].lower()
+        if not extension in ['.npz', '.csv'] :
+            raise ValueError('Unsupported export format ' + extension)
+
+        content = self.data()
+        if extension == '.npz' :
+            arrays = {}
+            for i_column, name in enumerate(self.__columns) :
+                arrays[name] = content[:, i_column]
+            arrays['dropped'] = array(self.dropped())
+            with open(filename, 'wb') as file :
+                savez(file, **arrays)
+                file.close()
+        else :
+            with open(filename, 'w', encoding='UTF-8', newline='') as file :
+                output = writer(file)
+                output.writerow(self.__columns)
+                output.writerows(content.tolist())
+                file.close()
+
+    def export(self, filename, sheet) :
+        """ Export recorded samples as a scenario data set, so that the recorded scenario can be
+        replayed in read mode. Each step gives the measurements the software components received
+        from the robot dynamics, under the scenario data headers : yaw, pitch, roll and gesture
+        for the motion sensor, <port>_degrees for the motors, <port>_red, <port>_green,
+        <port>_blue, <port>_ambiant and <port>_reflected for the color sensors
+
+        :param filename: path to the data set workbook, its extension gives the format
+        :type filename:  string (.npz or .csv)
+        :param sheet:    name of the data set sheet
+        :type sheet:     string
+
+        :raises ValueError: unsupported export format or oldest samples overwritten, the data
+         set not starting with the scenario
+        """
+
+        if self.dropped() > 0 :
+            raise ValueError('Can not export a scenario whose ' + str(self.dropped()) + \
+                ' first samples were overwritten')
+
+        content = self.data()
+        columns = {}
+        for name in ['time', 'yaw', 'pitch', 'roll'] :
+            columns[name] = content[:, self.__columns.index(name)].tolist()
+        columns['gesture'] = [None] * content.shape[0]
+        for port in self.__motors :
+            i_column = self.__columns.index(port + '_degrees')
+            columns[port + '_degrees'] = content[:, i_column].tolist()
+        for port in self.__sensors :
+            measurements = ScenarioComponents.color_measurements(
+                content[:, self.__columns.index(port + '_red')],
+                content[:, self.__columns.index(port + '_green')],
+                content[:, self.__columns.index(port + '_blue')])
+            for name, values in zip(['red', 'green', 'blue', 'ambiant', 'reflected'],
+                                    measurements) :
+                columns[port + '_' + name] = full(content.shape[0], values).tolist()
+
+        ScenarioWorkbook(filename).write({ sheet : columns })
@@ -11,18 +11,23 @@
 # System includes
 from json                   import load
 from os                     import path
-from threading              import Thread
+from threading              import Thread, Condition
 from time                   import sleep
 from logging                import config, Logger
+from contextvars            import ContextVar
+from contextlib             import contextmanager
 
 # Local includes
 from spike.scenario.data            import ScenarioData
 from spike.scenario.timer           import ScenarioTimer
 from spike.scenario.commands        import ScenarioCommands
+from spike.scenario.waiters         import ScenarioWaiters
 from spike.scenario.components      import ScenarioComponents
 from spike.scenario.model           import ScenarioModel
 from spike.scenario.dynamics        import ScenarioDynamics
 from spike.scenario.ground          import ScenarioGround
+from spike.scenario.recorder        import ScenarioRecorder
+from spike.scenario.profiler        import ScenarioProfiler
 
 # pylint: disable=W0201, R0902, W0231
 # Singleton structure makes it that __init__ is called for each copy of the singleton
@@ -36,17 +41,28 @@ class ScenarioThreadData() :
     s_modes = ['read', 'compute']
     s_logger = Logger('scenario')
 
-    def __init__(self) :
-        """ Constructor """
+    def __init__(self, timer = None) :
+        """ Constructor
+
+        :param timer: clock of the scenario, default is None to use the process-wide clock
+        :type timer:  ScenarioTimer
+        """
+
+        if timer is not None : self.s_shared_timer = timer
 
         self.__model            = ScenarioModel()
         self.__mat              = ScenarioGround()
-        self.__dynamics         = ScenarioDynamics(self.__model, self.__mat)
+        self.__dynamics         = ScenarioDynamics(self.__model, self.__mat, self.s_shared_timer)
         self.__components       = ScenarioComponents()
         self.__data             = ScenarioData()
         self.__mode             = 'compute'
-        self.__commands         = ScenarioCommands()
-        self.__is_step_ongoing  = False
+        self.__commands         = ScenarioCommands(self.s_shared_timer)
+        self.__waiters          = ScenarioWaiters()
+        self.__observers        = []
+        self.__profiler         = None
+        self.__profile          = None
+        self.__tick             = Condition()
+        self.__date             = -1
         self.__is_started       = False
         self.reset()
 
@@ -55,6 +71,10 @@ class ScenarioThreadData() :
         self.s_logger.debug('Resetting ScenarioThreadData')
         self.reinitialize()
         self.__components.reset()
+        self.__observers = []
+        self.__profiler = None
+        self.__profile = None
+        self.__dynamics.profile(None)
 
     def reinitialize(self) :
         """
@@ -62,8 +82,9 @@ class ScenarioThreadData() :
         Keeps registered software components but reinitialize dynamics
         """
         self.__shall_continue = True
-        self.__is_step_ongoing  = False
-        self.__is_started = False
+        with self.__tick :
+            self.__date = -1
+            self.__is_started = False
         self.s_shared_timer.reset()
         self.__dynamics.reset()
 
@@ -102,10 +123,14 @@ class ScenarioThreadData() :
         # Configure robot
         self.__model.configure(robot)
         if self.__mode == 'compute' :
-            self.__dynamics = ScenarioDynamics(self.__model, self.__mat)
+            self.__dynamics = ScenarioDynamics(self.__model, self.__mat, self.s_shared_timer)
             self.__dynamics.configure(conf['data']['coordinates'])
+            self.__dynamics.profile(self.__profiler)
         elif self.__mode == 'read' :
-            self.__data.configure(path.dirname(scenario) + '/' + conf['data']['filename'], sheet)
+            stream = None
+            if 'stream' in conf['data'] : stream = conf['data']['stream']
+            self.__data.configure(
+                path.dirname(scenario) + '/' + conf['data']['filename'], sheet, stream)
 
         # Configure scenario
         self.__commands.configure(self.__dynamics)
@@ -122,8 +147,66 @@ class ScenarioThreadData() :
         :type port1:      string
         :param port2:     second port to check
         :type port2:      string
+
+        :raises ValueError: component can not be registered, or its measurements are not in
+         the data of a started scenario in read mode
+        """
+        headers = None
+        if self.__mode == 'read' and self.__data.is_loaded() and self.__is_started :
+            headers = self.__data.headers()
+        self.__components.register(component, port1, port2, headers)
+
+    def check(self) :
+        """
+        Check that the scenario data provide the measurements of the registered software
+        components in read mode
+
+        :raises ValueError: components measurements missing from the scenario data
+        """
+        if self.__mode == 'read' and self.__data.is_loaded() :
+            self.__components.check(self.__data.headers())
+
+    def observe(self, observer) :
+        """
+        Register a function called by the scenario thread after each step in compute mode
+
+        :param observer: function called with the step date and the robot dynamics, whose
+         measurements accessors give the robot state at this date
+        :type observer:  callable (float, ScenarioDynamics)
+        """
+        self.__observers.append(observer)
+
+    def record(self, capacity = None) :
         """
-        self.__components.register(component, port1, port2)
+        Record the robot state at each step in compute mode
+
+        :param capacity: maximum number of steps kept, default is None for the recorder default
+        :type capacity:  integer
+        :return:         the recorder the robot state is appended to
+        :rtype:          ScenarioRecorder
+        """
+        by_type = self.__model.by_type()
+        result = ScenarioRecorder(
+            sorted(part.port for part in by_type.get('Motor', [])),
+            sorted(part.port for part in by_type.get('ColorSensor', [])), capacity)
+        self.observe(result.record)
+        return result
+
+    def profile(self, filename = None) :
+        """
+        Measure the duration of each step phase, the steps jitter and missed deadlines
+        Measurements restart with each scenario run and are logged when the scenario is over
+
+        :param filename: path of the json file the measurements are written to when the
+         scenario is over, default is None to only log them
+        :type filename:  string
+        :return:         the profiler the measurements are recorded in
+        :rtype:          ScenarioProfiler
+        """
+        self.__profiler = ScenarioProfiler()
+        self.__profile = filename
+        self.__dynamics.profile(self.__profiler)
+        return self.__profiler
 
     def is_started(self) :
         """ Check if the processing is started
@@ -134,11 +217,40 @@ class ScenarioThreadData() :
         return self.__is_started
 
     def step(self) :
-        """ Step into time """
+        """ Step into time and wait for the scenario thread to process the new date """
         self.s_shared_timer.step()
-        self.__is_step_ongoing = True
-        while self.__is_step_ongoing:
-            sleep(self.s_shared_timer.s_sleep_time)
+        date = self.s_shared_timer.time()
+        with self.__tick :
+            self.__tick.wait_for(lambda : not self.__is_started or self.__date >= date)
+
+    def changes(self, component) :
+        """
+        Number of updates of a software component with new measurements
+
+        :param component: software component
+        :type component:  object (Button, ColorSensor,...)
+        :return:          the number of times the scenario updated the component
+        :rtype:           integer
+        """
+        return self.__waiters.changes(component)
+
+    def wait(self, date = None, component = None, changes = None) :
+        """
+        Wait for the scenario thread to process its next step, or to update the given
+        component with new measurements
+        In virtual time mode, the date the caller is waiting for enables the scenario to move
+        straight to this date when nothing changes in between
+
+        :param date:      date the caller is waiting for, default is None if the caller is
+         waiting for a measurement to change
+        :type date:       float (seconds)
+        :param component: software component the caller is waiting for, default is None
+        :type component:  object (Button, ColorSensor,...)
+        :param changes:   component updates count read before checking its measurements,
+         default is None
+        :type changes:    integer
+        """
+        self.__waiters.wait(date, component, changes)
 
     def command(self, component, name, args) :
         """
@@ -156,6 +268,17 @@ class ScenarioThreadData() :
         """
         return self.__commands.give(component, name, args)
 
+    def process(self, command) :
+        """
+        Process command until over
+
+        :param command: command to process
+        :type command:  generator function
+        """
+        self.__commands.process(command)
+        # Command may have changed components, waiters shall check them again
+        self.__waiters.notify()
+
     def get_status(self) :
         """ Return current robot status
 
@@ -199,25 +322,46 @@ class ScenarioThreadData() :
 
             self.__dynamics.reset()
             self.s_shared_timer.reset()
-            while self.shall_continue():
-
+            profiler = self.__profiler
+            if profiler is not None : profiler.reset()
+            self.__commands.open(self.__wake)
+            self.__waiters.open(self.__wake)
+            with self.__tick :
                 self.__is_started = True
+                self.__tick.notify_all()
+
+            while self.shall_continue():
 
                 # Get current time
                 time = self.s_shared_timer.time()
+                if profiler is not None :
+                    profiler.start(self.s_shared_timer.period(),
+                        self.s_shared_timer.mode() == 'realtime')
 
                 # Manage update from measurements
+                updated = []
                 if self.__mode == 'read' :
-                    self.__components.update_from_data(time, self.__data)
+                    updated = self.__components.update_from_data(time, self.__data)
                 elif self.__mode == 'compute' :
-                    self.__components.update_from_mecanics(time, self.__dynamics)
-                    self.__dynamics.extrapolate(time)
-
-                # command = self.process_command(self.__dynamics)
-                # shall_continue = next(command)
-
-                self.__is_step_ongoing = False
-                self.s_shared_timer.sleep()
+                    updated = self.__components.update_from_mecanics(time, self.__dynamics)
+                    for observer in self.__observers : observer(time, self.__dynamics)
+                if profiler is not None : profiler.lap('components')
+
+                # Move pending commands forward now that measurements are updated
+                self.__commands.advance()
+                if profiler is not None : profiler.lap('commands')
+
+                # Signal step completion to the waiting threads
+                with self.__tick :
+                    self.__date = time
+                    self.__tick.notify_all()
+                self.__waiters.notify(updated)
+                if profiler is not None :
+                    profiler.lap('notification')
+                    profiler.stop()
+
+                if self.s_shared_timer.mode() == 'virtual' : self.__forward()
+                else : self.s_shared_timer.sleep(time)
 
 # pylint: disable=W0703
         except Exception as exc:
@@ -225,8 +369,41 @@ class ScenarioThreadData() :
             self.set_shall_continue(False)
 # pylint: enable=W0703
 
+        self.__commands.close()
+        self.__waiters.close()
+        with self.__tick :
+            self.__is_started = False
+            self.__tick.notify_all()
 
         self.s_logger.info('Scenario is over')
+        if self.__profiler is not None : self.__profiler.dump(self.__profile)
+
+    def __wake(self) :
+        """ Wake the scenario thread up when a command is handed over to it """
+        with self.__tick :
+            self.__tick.notify_all()
+
+    def __forward(self) :
+        """
+        Move time forward in virtual time mode
+        While the end-user thread is blocked waiting for the scenario, time goes forward
+        without delay. If all the blocked callers are waiting for a date while the robot
+        is motionless, time goes straight to the earliest date, since no measurement can
+        change in between. If no caller is blocked, the scenario waits for a time period before
+        stepping forward, so that end-user programs polling measurements still progress.
+        """
+        with self.__tick :
+            self.__tick.wait_for(lambda : len(self.__waiters.dates()) > 0 or \
+                self.__commands.pending() > 0 or not self.shall_continue(),
+                self.s_shared_timer.period())
+            dates = self.__waiters.dates()
+
+        date = None
+        if self.__mode == 'compute' and len(dates) > 0 and None not in dates and \
+           self.__commands.pending() == 0 and self.__dynamics.is_idle() :
+            date = min(dates)
+
+        self.s_shared_timer.forward(date)
 
     def __check_configuration(self, conf, sheet) :
         """
@@ -262,33 +439,85 @@ class ScenarioThreadData() :
                 raise ValueError('Missing initial coordinates information in data configuration')
 
 class Scenario() :
-    """ Singleton class managing the robot status """
+    """ Singleton class managing the robot status
+        Independent scenarios, each with its own clock, robot and components, can be created to
+        run several scenarios in parallel in the same process. Binding an independent scenario
+        to the current context makes the software components created in this context register
+        to it instead of the process-wide scenario.
+    """
 
     s_instance = None
+    s_context  = ContextVar('scenario', default = None)
     s_logger   = Logger('scenario')
 
     # pylint: disable=W0102
-    def __new__(cls):
+    def __new__(cls, shared = True):
         """ Class new function
 
-        :param cls: class reference
-        :type cls:  object
+        :param cls:    class reference
+        :type cls:     object
+        :param shared: True to get the scenario of the current context, or the process-wide one
+         if none is bound, False to create an independent scenario. Default is True
+        :type shared:  boolean
         """
 
-        if Scenario.s_instance is None :
-            Scenario.s_instance = super().__new__(cls)
-            Scenario.s_instance.s_init()
-        return Scenario.s_instance
+        result = None
+
+        if not shared :
+            result = super().__new__(cls)
+            result.s_init(ScenarioTimer(shared = False))
+        else :
+            result = Scenario.s_context.get()
+            if result is None :
+                if Scenario.s_instance is None :
+                    Scenario.s_instance = super().__new__(cls)
+                    Scenario.s_instance.s_init()
+                result = Scenario.s_instance
+
+        return result
+
+    def s_init(self, timer = None) :
+        """ Constructor for singleton / only called once
 
-    def s_init(self) :
-        """ Constructor for singleton / only called once """
+        :param timer: clock of the scenario, default is None to use the process-wide clock
+        :type timer:  ScenarioTimer
+        """
 
-        self.__processing_data      = ScenarioThreadData()
+        if timer is None : timer = ScenarioTimer()
+        self.__timer                = timer
+        self.__processing_data      = ScenarioThreadData(timer)
         self.__processing_thread    = None
 
-    def __init__(self) :
+    def __init__(self, shared = True) :
         """ Contructor for each instantiation / do nothing """
 
+    @contextmanager
+    def bind(self) :
+        """
+        Make the scenario and its clock the ones of the current context, so that the software
+        components created and the spike timing functions called in this context use them.
+        Threads do not inherit the context : each thread shall bind the scenario it uses
+
+        :return: context manager restoring the previous binding on exit
+        :rtype:  generator function
+        """
+        scenario = Scenario.s_context.set(self)
+        timer = ScenarioTimer.s_context.set(self.__timer)
+        try :
+            yield self
+        finally :
+            ScenarioTimer.s_context.reset(timer)
+            Scenario.s_context.reset(scenario)
+
+    def timer(self) :
+        """
+        Return scenario clock
+
+        :return: the clock of the scenario
+        :rtype:  ScenarioTimer
+        """
+        return self.__timer
+
     # @property
     # def ports(self) :
     #     """ robot ports getter """
@@ -320,8 +549,52 @@ class Scenario() :
         """
         self.__processing_data.register_component(component, port1, port2)
 
+    def observe(self, observer) :
+        """
+        Register a function called by the scenario thread after each step in compute mode
+        Observers are deregistered when the scenario is reset
+
+        :param observer: function called with the step date and the robot dynamics, whose
+         position, orientation, degrees and color accessors give the robot state at this date
+        :type observer:  callable (float, ScenarioDynamics)
+        """
+        self.__processing_data.observe(observer)
+
+    def record(self, capacity = None) :
+        """
+        Record the robot state at each step in compute mode, in a preallocated ring buffer
+        The recorder stops recording when the scenario is reset
+
+        :param capacity: maximum number of steps kept, default is None for the recorder default
+        :type capacity:  integer
+        :return:         the recorder the robot state is appended to
+        :rtype:          ScenarioRecorder
+        """
+        return self.__processing_data.record(capacity)
+
+    def profile(self, filename = None) :
+        """
+        Measure the duration of each step phase --- components update, dynamics extrapolation,
+        colors sampling, commands processing and waiting threads notification --- with the steps
+        jitter and missed deadlines, in fixed size histograms
+        The measurements are logged and written to the file when the scenario is stopped, and
+        the profiler is released when the scenario is reset
+
+        :param filename: path of the json file the measurements are written to when the
+         scenario is stopped, default is None to only log them
+        :type filename:  string
+        :return:         the profiler the measurements are recorded in
+        :rtype:          ScenarioProfiler
+        """
+        return self.__processing_data.profile(filename)
+
     def start(self) :
-        """ Robot starting function """
+        """
+        Robot starting function
+
+        :raises ValueError: registered components measurements missing from the scenario data
+        """
+        self.__processing_data.check()
         self.__processing_data.reinitialize()
         self.__processing_thread    = Thread( target = self.__processing_data.run)
         self.__processing_thread.start()
@@ -332,6 +605,35 @@ class Scenario() :
         """ Step into time from a period set by configuation"""
         self.__processing_data.step()
 
+    def changes(self, component) :
+        """
+        Number of updates of a software component with new measurements, to be read before
+        checking the component measurements and waiting for them to change
+
+        :param component: software component
+        :type component:  object (Button, ColorSensor,...)
+        :return:          the number of times the scenario updated the component
+        :rtype:           integer
+        """
+        return self.__processing_data.changes(component)
+
+    def wait(self, date = None, component = None, changes = None) :
+        """
+        Wait for the scenario to update the software components
+
+        :param date:      date the caller is waiting for, default is None if the caller is
+         waiting for a measurement to change
+        :type date:       float (seconds)
+        :param component: software component the caller is waiting for, default is None to
+         wait for the next scenario update
+        :type component:  object (Button, ColorSensor,...)
+        :param changes:   component updates count, as given by the changes function before
+         checking the component measurements, default is None. The caller is released at once
+         if the component was updated since, so that no update is missed
+        :type changes:    integer
+        """
+        self.__processing_data.wait(date, component, changes)
+
     def command(self, component, name, args ) :
         """
         Process new robot command
@@ -350,12 +652,21 @@ class Scenario() :
             component, name, args
         )
 
+    def process(self, command) :
+        """
+        Process robot command until over, in lock-step with the scenario updates
+
+        :param command: command to perform, as returned by the command function
+        :type command:  generator function
+        """
+        self.__processing_data.process(command)
+
     def stop(self) :
         """ End scenario """
 
         self.__processing_data.set_shall_continue(False)
-        while   self.__processing_thread is not None and \
-                self.__processing_thread.is_alive() : pass
+        if self.__processing_thread is not None :
+            self.__processing_thread.join()
         self.__processing_data.reinitialize()
 
     def reset(self) :
@@ -10,42 +10,71 @@
 
 # System includes
 from time       import time, sleep
-from threading  import Lock
+from math       import ceil
+from threading  import Lock, Condition
 from logging    import getLogger
+from contextvars import ContextVar
+
+# Local includes
+from spike.scenario.trace   import ScenarioTrace
 
 # pylint: disable=W0201, W0231
 # Singleton structure makes it that __init__ is called for each copy of the singleton
 # To avoid having it reinitialize the shared object, init is done once when calling
 # __new__
 class ScenarioTimer() :
-    """ Singleton providing world clock to all timers """
+    """ Singleton providing world clock to all timers
+        The clock state is published as an immutable snapshot (mode, time, reference time)
+        replaced at once each time it changes, so that the clock readers never take the mutex.
+        Independent clocks can be created for scenarios running in parallel : the clock bound
+        to the current context is then returned instead of the process-wide one.
+    """
 
     s_instance = None
+    s_context  = ContextVar('timer', default = None)
     s_sleep_time = 0.01
     """ Scenario measurements update frequency --- Compliant with spike sensors frequency 100Hz """
+    s_modes = ['realtime', 'controlled', 'virtual']
     s_logger = getLogger('time')
+    s_trace  = ScenarioTrace('time')
 
 # pylint: disable=W0102
-    def __new__(cls):
+    def __new__(cls, shared = True):
         """ Class new function
 
-        :param cls: class reference
-        :type cls:  object
+        :param cls:    class reference
+        :type cls:     object
+        :param shared: True to get the clock of the current context, or the process-wide one
+         if none is bound, False to create an independent clock. Default is True
+        :type shared:  boolean
         """
 
-        if ScenarioTimer.s_instance is None :
-            ScenarioTimer.s_instance = super().__new__(cls)
-            ScenarioTimer.s_instance.s_init()
-        return ScenarioTimer.s_instance
+        result = None
+
+        if not shared :
+            result = super().__new__(cls)
+            result.s_init()
+        else :
+            result = ScenarioTimer.s_context.get()
+            if result is None :
+                if ScenarioTimer.s_instance is None :
+                    ScenarioTimer.s_instance = super().__new__(cls)
+                    ScenarioTimer.s_instance.s_init()
+                result = ScenarioTimer.s_instance
+
+        return result
 
     def s_init(self) :
         """ Constructor for singleton / only called once """
         self.__time             = 0
+        self.__steps            = 0
         self.__reference_time   = 0
         self.__mutex            = Lock()
+        self.__step             = Condition(self.__mutex)
         self.__configuration    = {}
+        self.__clock            = (None, 0, 0)
 
-    def __init__(self) :
+    def __init__(self, shared = True) :
         """ Contructor for each instantiation / do nothing """
 
     def reset(self) :
@@ -54,6 +83,9 @@ class ScenarioTimer() :
             self.s_logger.info('Resetting timer')
             self.__reference_time = time()
             self.__time = 0
+            self.__steps = 0
+            self.__publish()
+            self.__step.notify_all()
 
     def configure(self, configuration) :
         """
@@ -61,34 +93,96 @@ class ScenarioTimer() :
 
         :param configuration: configuration values
         :type configuration:  dictionary (mode + parameters)
+
+        :raises ValueError: unknown time mode or missing period
         """
+        if not 'mode' in configuration :
+            raise ValueError('Missing mode information in scenario time configuration')
+        if not configuration['mode'] in self.s_modes :
+            raise ValueError('Unknown time mode ' + configuration['mode'])
+        if configuration['mode'] != 'realtime' and not 'period' in configuration :
+            raise ValueError('Missing period information in scenario time configuration')
+
         with self.__mutex :
             self.s_logger.info('Configuring timer')
             self.__configuration = configuration
             self.__reference_time = time()
             self.__time = 0
-            self.s_logger.info('World clock configuration : %s',str(self.__configuration))
+            self.__steps = 0
+            self.__publish()
+            self.s_logger.info('World clock configuration : %s', self.__configuration)
 
-    def sleep(self) :
+    def mode(self) :
+        """
+        Time mode accessor
+
+        :return: current time mode
+        :rtype:  string (realtime, controlled or virtual)
+        """
+        return self.__configuration['mode']
+
+    def period(self) :
+        """
+        Time period accessor
+
+        :return: number of seconds passing at each scenario step, the update period for
+         realtime mode
+        :rtype:  float (seconds)
+        """
+        result = self.s_sleep_time
+        if 'period' in self.__configuration : result = self.__configuration['period']
+        return result
+
+    def sleep(self, date = None) :
         """
         Pause scenario according to time mode
-        In controlled mode, the scenario shall sleep longer than the main thread to make sure
-        no step is missed on the main thread part.
+        In controlled mode, the scenario waits until the main thread steps into time, so that
+        each step is processed as soon as it is requested and no step is missed. The wait is
+        bounded so that the scenario can still check if it shall continue.
         In relatime mode, the scenario shall sleep less than the main thread to make sure
         the measurements are updated at each main thread call.
+        In virtual mode, the scenario does not sleep : time is moved forward by the scenario
+        itself using the forward function.
+
+        :param date: world time of the last processed scenario step, default is None
+        :type date:  float (seconds)
         """
 
         if self.__configuration['mode'] == 'controlled' :
-            sleep(self.s_sleep_time * 2)
-        else :
+            with self.__step :
+                self.__step.wait_for(lambda : self.__time != date, self.s_sleep_time * 2)
+        elif self.__configuration['mode'] == 'realtime' :
             sleep(self.s_sleep_time * 0.5)
 
     def step(self) :
         """ Function that steps into time - controlled scenario only """
         if self.__configuration['mode'] == 'controlled' :
-            with self.__mutex :
+            with self.__step :
                 self.__time += self.__configuration['period']
-            self.s_logger.info('stepping %lf to %lf', self.__configuration['period'], self.__time)
+                self.__publish()
+                self.__step.notify_all()
+            self.s_trace.trace('stepping %lf to %lf', self.__configuration['period'], self.__time)
+
+    def forward(self, date = None) :
+        """
+        Function that moves time forward - virtual scenario only
+        Time always stays on the period grid, so that the dates processed are the same
+        whether some steps are skipped or not.
+
+        :param date: date to reach, default is None for a single period step
+        :type date:  float (seconds)
+        """
+        if self.__configuration['mode'] == 'virtual' :
+            with self.__step :
+                period = self.__configuration['period']
+                steps = 1
+                if date is not None :
+                    steps = max(1, ceil((date - self.__time) / period - 1e-6))
+                self.__steps += steps
+                self.__time = self.__steps * period
+                self.__publish()
+                self.__step.notify_all()
+            self.s_trace.trace('forwarding %d steps to %lf', steps, self.__time)
 
     def time(self) :
         """
@@ -97,15 +191,15 @@ class ScenarioTimer() :
         :return: current time in the world
         :rtype:  float (seconds)
         """
-        result = 0
-        with self.__mutex :
-            if self.__configuration['mode'] == 'controlled' :
-                result = self.__time
-            elif self.__configuration['mode'] == 'realtime' :
-                result = time() - self.__reference_time
+        mode, result, reference = self.__clock
+        if mode == 'realtime' : result = time() - reference
 
-        self.s_logger.info('Current world time: %lf', result)
+        self.s_trace.trace('Current world time: %lf', result)
 
         return result
 
+    def __publish(self) :
+        """ Publish the clock state snapshot - Shall be called with the mutex acquired """
+        self.__clock = (self.__configuration.get('mode'), self.__time, self.__reference_time)
+
 # pylint: enable=W0102, W0201, W0231
@@ -0,0 +1,64 @@
+# -------------------------------------------------------
+# Copyright (c) [2022] Nadege LEMPERIERE
+# All rights reserved
+# -------------------------------------------------------
+""" Scenario hot path logging """
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @04 november 2022
+# Latest revision: 04 november 2022
+# -------------------------------------------------------
+
+# System includes
+from logging    import getLogger, addLevelName
+
+class ScenarioTrace() :
+    """ Logging facility for the functions called at each scenario step
+        Trace messages are emitted at the TRACE level, below DEBUG, so that they can be activated
+        subsystem by subsystem without flooding the other logs. The message arguments are only
+        formatted when the message is emitted : objects shall be given as arguments instead of
+        their string representation, so that a disabled trace costs a level check only.
+    """
+
+    s_level  = 5
+    s_name   = 'TRACE'
+
+    @staticmethod
+    def configure(levels) :
+        """
+        Static method to set the subsystems logging levels
+
+        :param levels: logging level of each subsystem logger
+        :type levels:  dictionary {subsystem : level}, level name (TRACE, DEBUG,...) or value
+        """
+        for subsystem, level in levels.items() :
+            getLogger(subsystem).setLevel(level)
+
+    def __init__(self, subsystem) :
+        """ Constructor
+
+        :param subsystem: name of the subsystem logger
+        :type subsystem:  string
+        """
+        self.__logger = getLogger(subsystem)
+
+    def is_enabled(self) :
+        """ Check if the subsystem traces are emitted, to avoid computing costly trace arguments
+
+        :return: True if the subsystem logger is enabled for the TRACE level
+        :rtype:  boolean
+        """
+        return self.__logger.isEnabledFor(self.s_level)
+
+    def trace(self, message, *args) :
+        """
+        Emit a trace message, the arguments being formatted only if the message is emitted
+
+        :param message: message format, using % style
+        :type message:  string
+        :param args:    message arguments
+        :type args:     tuple
+        """
+        if self.__logger.isEnabledFor(self.s_level) :
+            self.__logger.log(self.s_level, message, *args)
+
+addLevelName(ScenarioTrace.s_level, ScenarioTrace.s_name)
@@ -0,0 +1,136 @@
+# -------------------------------------------------------
+# Copyright (c) [2022] Nadege LEMPERIERE
+# All rights reserved
+# -------------------------------------------------------
+""" End-user threads waiting for scenario updates management """
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @04 november 2022
+# Latest revision: 04 november 2022
+# -------------------------------------------------------
+
+# System includes
+from time                   import sleep
+from threading              import Lock, Event
+from weakref                import WeakKeyDictionary
+
+# Local includes
+from spike.scenario.timer   import ScenarioTimer
+
+class ScenarioWaiters() :
+    """ Class managing the threads waiting for the scenario to update the software components
+        Each component update is counted, so that a caller checking a component measurement
+        before waiting for it to change is released at once if the component was updated in
+        between, instead of missing the update. Counts are kept by component as long as the
+        component lives, so that a new component never inherits the count of a deleted one.
+    """
+
+    s_shared_timer = ScenarioTimer()
+
+    def __init__(self) :
+        """ Constructor """
+
+        self.__mutex      = Lock()
+        self.__waiting    = []
+        self.__changes    = WeakKeyDictionary()
+        self.__is_open    = False
+        self.__listener   = None
+
+    def open(self, listener = None) :
+        """
+        Start releasing waiters along scenario steps - Called by the scenario thread
+
+        :param listener: function called each time a thread starts waiting, default is None
+        :type listener:  callable
+        """
+        with self.__mutex :
+            self.__listener = listener
+            self.__is_open = True
+
+    def close(self) :
+        """
+        Stop releasing waiters along scenario steps - Called by the scenario thread
+        Threads still waiting are released so that no caller remains blocked
+        """
+        with self.__mutex :
+            self.__listener = None
+            self.__is_open = False
+        self.notify()
+
+    def changes(self, component) :
+        """
+        Number of updates of a software component with new measurements
+
+        :param component: software component
+        :type component:  object (Button, ColorSensor,...)
+        :return:          the number of times the scenario updated the component
+        :rtype:           integer
+        """
+        with self.__mutex :
+            result = self.__changes.get(component, 0)
+        return result
+
+    def wait(self, date = None, component = None, changes = None) :
+        """
+        Wait for the scenario to update the software components
+        If a component is given, the caller is only released when the scenario updates this
+        component with new measurements. Otherwise, it is released at the next scenario step.
+        When the scenario is not processing, the wait is bounded by the scenario update period
+        so that callers still progress.
+
+        :param date:      date the caller is waiting for, default is None
+        :type date:       float (seconds)
+        :param component: software component the caller is waiting for, default is None
+        :type component:  object (Button, ColorSensor,...)
+        :param changes:   component updates count read before checking its measurements,
+         default is None. The caller returns at once if the component was updated since
+        :type changes:    integer
+        """
+
+        waiter = { 'date' : date, 'component' : component, 'done' : Event() }
+        with self.__mutex :
+            is_open = self.__is_open
+            listener = self.__listener
+            updated = component is not None and changes is not None and \
+                self.__changes.get(component, 0) != changes
+            if is_open and not updated : self.__waiting.append(waiter)
+
+        if is_open and not updated :
+            if listener is not None : listener()
+            waiter['done'].wait()
+        elif not updated :
+            sleep(self.s_shared_timer.s_sleep_time)
+
+    def dates(self) :
+        """
+        Dates of the threads currently waiting
+
+        :return: the dates the callers are waiting for, None for the callers waiting for a
+         scenario update
+        :rtype:  list
+        """
+        with self.__mutex :
+            result = [waiter['date'] for waiter in self.__waiting]
+        return result
+
+    def notify(self, components = None) :
+        """
+        Release waiters after a scenario step - Called by the scenario thread
+
+        :param components: software components updated with new measurements during the step,
+         default is None to release all waiters
+        :type components:  list
+        """
+
+        updated = []
+        if components is not None : updated = [id(component) for component in components]
+
+        with self.__mutex :
+            for component in components or [] :
+                self.__changes[component] = self.__changes.get(component, 0) + 1
+            waiting = []
+            for waiter in self.__waiting :
+                if components is None or waiter['component'] is None or \
+                   id(waiter['component']) in updated :
+                    waiter['done'].set()
+                else : waiting.append(waiter)
+            self.__waiting = waiting
@@ -0,0 +1,506 @@
+# -------------------------------------------------------
+# Copyright (c) [2022] Nadege LEMPERIERE
+# All rights reserved
+# -------------------------------------------------------
+""" Tabular data files management """
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @04 november 2022
+# Latest revision: 04 november 2022
+# -------------------------------------------------------
+
+# System includes
+from os         import path, stat, makedirs, replace, getpid, remove
+from csv        import reader, writer
+from glob       import glob
+from hashlib    import sha1
+from threading  import Lock
+from collections import OrderedDict
+from logging    import getLogger
+from struct     import unpack
+from zipfile    import ZipFile, ZIP_STORED
+
+# Numpy includes
+from numpy      import array, asarray, memmap, load, savez, ndarray, generic
+from numpy.lib.format import read_magic, read_array_header_1_0, read_array_header_2_0
+from numpy.lib.format import read_array
+
+# Openpyxl includes
+from openpyxl   import load_workbook
+
+class ScenarioWorkbook() :
+    """ Class reading tabular data from a workbook, whatever its format
+        The workbook is made of sheets, each sheet containing columns of data associated
+        to the header on their first row. Supported formats are :
+
+        - excel workbooks (.xlsx, .xlsm)
+        - csv files (.csv), one file per sheet named <workbook>.<sheet>.csv. If no such file
+          exists, the workbook file itself is used as the single sheet
+        - numpy archives (.npz), containing all the sheets. Each column is stored with its type
+          so that the values are read back unchanged, the integers of a column also holding
+          floats being stored as floats. The columns holding a single type are read at once as
+          numpy arrays, memory mapped if the archive is not compressed
+
+        Parsed sheets are cached on disk as numpy archives, keyed by file path, modification
+        date and sheet, so that each workbook is parsed only once. The most recently read sheets
+        are also kept in memory, the other sheets of an excel workbook parsed at the same time
+        being only cached on disk.
+    """
+
+    s_formats = ['.xlsx', '.xlsm', '.csv', '.npz']
+    s_kinds   = { 'b' : 'bool', 'i' : 'int', 'u' : 'int', 'f' : 'float', 'U' : 'str' }
+    """ Columns kinds by numpy array kind """
+    s_logger  = getLogger('workbook')
+    s_cache   = OrderedDict()
+    s_cache_size = 16
+    """ Maximum number of parsed sheets kept in memory """
+    s_mutex   = Lock()
+    s_cache_directory = path.join(path.expanduser('~'), '.cache', 'spike-mock')
+
+    @staticmethod
+    def configure(directory) :
+        """
+        Static method to set the directory in which parsed sheets are cached on disk
+
+        :param directory: cache directory, None to disable on-disk caching
+        :type directory:  string
+        """
+        ScenarioWorkbook.s_cache_directory = directory
+
+    def __init__(self, filename) :
+        """ Constructor
+
+        :param filename: path to the workbook file
+        :type filename:  string
+
+        :raises ValueError: unknown workbook format
+        """
+
+        self.__filename = filename
+        self.__format   = path.splitext(filename)[1].lower()
+        if not self.__format in self.s_formats :
+            raise ValueError('Unknown workbook format ' + self.__format)
+
+    def sheets(self) :
+        """ Workbook sheets list
+
+        :return: names of the workbook sheets
+        :rtype:  list
+        """
+
+        result = []
+
+        if self.__format == '.csv' :
+            stem = path.splitext(self.__filename)[0]
+            for filename in sorted(glob(stem + '.*.csv')) :
+                result.append(filename[len(stem) + 1:-len('.csv')])
+        elif self.__format == '.npz' :
+            with load(self.__filename, allow_pickle = False) as content :
+                result = [name for name in content.files if not '/' in name]
+        else :
+            wbook = load_workbook(self.__filename, read_only = True)
+            result = wbook.sheetnames
+            wbook.close()
+
+        return result
+
+    def read(self, sheet) :
+        """ Read a workbook sheet content
+
+        :param sheet: name of the sheet to read
+        :type sheet:  string
+
+        :raises ValueError: sheet not found in workbook
+
+        :return: the sheet columns associated to their header, in the sheet order. Columns
+         stop at the first empty header. The numpy archives columns holding a single type are
+         given as read-only numpy arrays, the other columns as lists
+        :rtype:  dictionary
+        """
+
+        result = {}
+
+        if self.__format == '.npz' :
+            # Numpy archives are read as columns, without parsing or caching
+            result = self.__columns(sheet)
+        else :
+            key = self.__key(sheet)
+            with self.s_mutex :
+                content = self.s_cache.get(key)
+                if content is not None : self.s_cache.move_to_end(key)
+            if content is None : content = self.__load_cache(key)
+            if content is None and self.__format in ['.xlsx', '.xlsm'] :
+                # Parse the other sheets while the workbook is open, for the on-disk cache only
+                wbook = load_workbook(self.__filename, data_only = True, read_only = True)
+                try :
+                    for name in wbook.sheetnames :
+                        if name == sheet :
+                            content = self.__parse(self.__excel_rows(wbook, name))
+                            self.__store_cache(key, content)
+                        elif self.s_cache_directory is not None and \
+                             not path.isfile(self.__cache_file((key[0], key[1], name))) :
+                            self.__write_cache((key[0], key[1], name),
+                                self.__parse(self.__excel_rows(wbook, name)))
+                finally :
+                    wbook.close()
+            elif content is None :
+                content = self.__parse(self.rows(sheet))
+                self.__store_cache(key, content)
+            if content is None :
+                raise ValueError('Sheet ' + sheet + ' not found in ' + self.__filename)
+
+            # Copy lists so that the cached content is never modified, arrays being read-only
+            for header, values in content.items() :
+                result[header] = values if isinstance(values, ndarray) else list(values)
+
+        return result
+
+    def rows(self, sheet) :
+        """ Read a workbook sheet content row by row, without loading the whole sheet when
+        the format allows it (excel and csv)
+
+        :param sheet: name of the sheet to read
+        :type sheet:  string
+
+        :raises ValueError: sheet not found in workbook
+
+        :return: generator providing first the headers list, then the content of each row
+         as a list of the same size
+        :rtype:  generator function
+        """
+
+        result = None
+
+        if self.__format == '.csv' :
+            result = self.__read_csv(sheet)
+        elif self.__format == '.npz' :
+            result = self.__read_npz(sheet)
+        else :
+            result = self.__read_excel(sheet)
+
+        return result
+
+    def save(self, filename) :
+        """ Convert all the workbook sheets into another format
+
+        :param filename: path to the converted workbook, its extension gives the format
+        :type filename:  string (.csv or .npz)
+
+        :raises ValueError: unsupported conversion format
+        """
+
+        extension = path.splitext(filename)[1].lower()
+        if not extension in ['.csv', '.npz'] :
+            raise ValueError('Unsupported conversion format ' + extension)
+
+        content = {}
+        for sheet in self.sheets() :
+            content[sheet] = self.read(sheet)
+
+        ScenarioWorkbook(filename).write(content)
+
+    def write(self, content) :
+        """ Write sheets into the workbook, replacing its previous content
+
+        :param content: the sheets columns associated to their header, by sheet name
+        :type content:  dictionary {sheet : {header : list}}
+
+        :raises ValueError: unsupported writing format
+        """
+
+        if not self.__format in ['.csv', '.npz'] :
+            raise ValueError('Unsupported conversion format ' + self.__format)
+
+        if self.__format == '.csv' :
+            stem = path.splitext(self.__filename)[0]
+            for sheet, columns in content.items() :
+                with open(stem + '.' + sheet + '.csv', 'w', encoding='UTF-8', newline='') as file :
+                    output = writer(file)
+                    output.writerow(list(columns.keys()))
+                    for row in zip(*columns.values()) :
+                        output.writerow([self.__encode(value) for value in row])
+                    file.close()
+        else :
+            arrays = {}
+            for sheet, columns in content.items() :
+                arrays[sheet] = array(list(columns.keys()), dtype = str)
+                kinds = []
+                for i_column, values in enumerate(columns.values()) :
+                    values, kind = self.__to_array(values)
+                    arrays[sheet + '/' + str(i_column)] = values
+                    kinds.append(kind)
+                arrays[sheet + '/kinds'] = array(kinds, dtype = str)
+            with open(self.__filename, 'wb') as file :
+                savez(file, **arrays)
+                file.close()
+
+    @staticmethod
+    def __parse(rows) :
+        """ Parse a sheet rows, headers first, into columns associated to their header """
+
+        result = {}
+
+        headers = next(rows)
+        for header in headers : result[header] = []
+        for row in rows :
+            for i_column, header in enumerate(headers) :
+                result[header].append(row[i_column])
+
+        return result
+
+    def __key(self, sheet) :
+        """ Cache key for a sheet : path and modification date of the file containing it """
+
+        filename = self.__filename
+        if self.__format == '.csv' :
+            filename = path.splitext(self.__filename)[0] + '.' + sheet + '.csv'
+            if not path.isfile(filename) : filename = self.__filename
+        if not path.isfile(filename) :
+            raise ValueError('Sheet ' + sheet + ' not found in ' + self.__filename)
+
+        return (path.abspath(filename), stat(filename).st_mtime_ns, sheet)
+
+    def __cache_file(self, key) :
+        """ Path of the on-disk cache file for a key """
+        return path.join(self.s_cache_directory,
+            sha1(repr(key).encode('UTF-8')).hexdigest() + '.npz')
+
+    def __load_cache(self, key) :
+        """ Load a sheet from the on-disk cache, None if not cached. Unreadable cache files
+        are removed """
+
+        result = None
+
+        if self.s_cache_directory is not None and path.isfile(self.__cache_file(key)) :
+            try :
+                result = ScenarioWorkbook(self.__cache_file(key)).read('sheet')
+                self.__remember(key, result)
+# pylint: disable=W0703
+            except Exception as exc :
+                self.s_logger.warning('Discarding unreadable workbook cache : %s', str(exc))
+                result = None
+                try :
+                    remove(self.__cache_file(key))
+                except OSError :
+                    pass
+# pylint: enable=W0703
+
+        return result
+
+    def __store_cache(self, key, content) :
+        """ Store a sheet in memory and on disk cache """
+        self.__remember(key, content)
+        self.__write_cache(key, content)
+
+    def __remember(self, key, content) :
+        """ Store a sheet in memory cache, forgetting the previous versions of its file and the
+        least recently used sheets """
+
+        with self.s_mutex :
+            for cached in [cached for cached in self.s_cache \
+                           if cached[0] == key[0] and cached[1] != key[1]] :
+                del self.s_cache[cached]
+            self.s_cache[key] = content
+            self.s_cache.move_to_end(key)
+            while len(self.s_cache) > self.s_cache_size :
+                self.s_cache.popitem(last = False)
+
+    def __write_cache(self, key, content) :
+        """ Store a sheet in on-disk cache, as a numpy archive which can not hold any code """
+
+        if self.s_cache_directory is not None :
+            try :
+                makedirs(self.s_cache_directory, exist_ok = True)
+                filename = self.__cache_file(key)
+                temporary = path.splitext(filename)[0] + '.' + str(getpid()) + '.tmp.npz'
+                ScenarioWorkbook(temporary).write({ 'sheet' : content })
+                replace(temporary, filename)
+            except OSError as exc :
+                self.s_logger.warning('Could not write workbook cache : %s', str(exc))
+
+    def __read_excel(self, sheet) :
+        """ Read sheet from excel workbook row by row """
+
+        wbook = load_workbook(self.__filename, data_only = True, read_only = True)
+        try :
+            if not sheet in wbook.sheetnames :
+                raise ValueError('Sheet ' + sheet + ' not found in ' + self.__filename)
+            yield from self.__excel_rows(wbook, sheet)
+        finally :
+            wbook.close()
+
+    def __excel_rows(self, wbook, sheet) :
+        """ Read sheet from an opened excel workbook row by row """
+
+        rows = wbook[sheet].iter_rows(values_only = True)
+        headers = self.__headers(next(rows, ()))
+        yield headers
+        for row in rows :
+            yield [row[i_column] if i_column < len(row) else None \
+                for i_column in range(len(headers))]
+
+    def __read_csv(self, sheet) :
+        """ Read sheet from csv file row by row """
+
+        filename = path.splitext(self.__filename)[0] + '.' + sheet + '.csv'
+        if not path.isfile(filename) : filename = self.__filename
+        if not path.isfile(filename) :
+            raise ValueError('Sheet ' + sheet + ' not found in ' + self.__filename)
+
+        with open(filename, 'r', encoding='UTF-8', newline='') as file :
+            rows = reader(file)
+            headers = self.__headers([self.__decode(value) for value in next(rows, [])])
+            yield headers
+            for row in rows :
+                yield [self.__decode(row[i_column]) if i_column < len(row) else None \
+                    for i_column in range(len(headers))]
+            file.close()
+
+    def __read_npz(self, sheet) :
+        """ Read sheet from numpy archive row by row - Only used for streaming, since the
+        archive columns are read at once """
+
+        columns = self.__columns(sheet)
+        yield list(columns.keys())
+        columns = [values.tolist() if isinstance(values, ndarray) else values \
+            for values in columns.values()]
+        for row in zip(*columns) :
+            yield list(row)
+
+    def __columns(self, sheet) :
+        """ Read sheet columns from numpy archive """
+
+        result = {}
+
+        with ZipFile(self.__filename) as archive, open(self.__filename, 'rb') as file :
+            if not sheet + '.npy' in archive.namelist() :
+                raise ValueError('Sheet ' + sheet + ' not found in ' + self.__filename)
+            headers = self.__member(archive, file, sheet).tolist()
+            kinds = []
+            if sheet + '/kinds.npy' in archive.namelist() :
+                kinds = self.__member(archive, file, sheet + '/kinds').tolist()
+            for i_column, header in enumerate(headers) :
+                values = self.__member(archive, file, sheet + '/' + str(i_column))
+                if i_column < len(kinds) and kinds[i_column] == 'mixed' :
+                    values = [self.__unmark(value) for value in values.tolist()]
+                result[header] = values
+            file.close()
+
+        return result
+
+    def __member(self, archive, file, name) :
+        """ Read an array from numpy archive, memory mapped if it is stored uncompressed """
+
+        result = None
+
+        info = archive.getinfo(name + '.npy')
+        if info.compress_type == ZIP_STORED :
+            # The array file follows the zip local header, whose size depends on its name and
+            # extra field lengths
+            file.seek(info.header_offset)
+            header = file.read(30)
+            file.seek(info.header_offset + 30 + \
+                unpack('<H', header[26:28])[0] + unpack('<H', header[28:30])[0])
+            if read_magic(file) == (1, 0) :
+                shape, fortran, dtype = read_array_header_1_0(file)
+            else :
+                shape, fortran, dtype = read_array_header_2_0(file)
+            if not dtype.hasobject and min(shape, default = 1) > 0 :
+                result = asarray(memmap(self.__filename, dtype = dtype, mode = 'r',
+                    offset = file.tell(), shape = shape, order = 'F' if fortran else 'C'))
+        if result is None :
+            with archive.open(info) as member :
+                result = read_array(member, allow_pickle = False)
+
+        return result
+
+    @staticmethod
+    def __headers(row) :
+        """ Extract headers from first row, stopping at the first empty header """
+        result = []
+        for value in row :
+            if value is None : break
+            result.append(value)
+        return result
+
+    @staticmethod
+    def __encode(value) :
+        """ Convert a value into text """
+        result = ''
+        if value is not None : result = str(value)
+        return result
+
+    @staticmethod
+    def __decode(value) :
+        """ Convert text into value """
+        result = value
+        if value == '' :
+            result = None
+        elif value in ['True', 'False'] :
+            result = value == 'True'
+        else :
+            try :
+                result = int(value)
+            except ValueError :
+                try :
+                    result = float(value)
+                except ValueError :
+                    result = value
+        return result
+
+    @staticmethod
+    def __mark(value) :
+        """ Convert a value into text prefixed by its type : b(oolean), i(nteger), f(loat),
+        s(tring) or n(one) """
+        result = 'n'
+        if isinstance(value, bool) :
+            result = 'b' + str(value)
+        elif isinstance(value, int) :
+            result = 'i' + str(value)
+        elif isinstance(value, float) :
+            result = 'f' + repr(value)
+        elif value is not None :
+            result = 's' + str(value)
+        return result
+
+    @staticmethod
+    def __unmark(text) :
+        """ Convert text prefixed by its type into value """
+        result = text[1:]
+        if text[:1] == 'b' :
+            result = result == 'True'
+        elif text[:1] == 'i' :
+            result = int(result)
+        elif text[:1] == 'f' :
+            result = float(result)
+        elif text[:1] == 'n' :
+            result = None
+        return result
+
+    def __to_array(self, values) :
+        """ Convert a column into the most compact numpy array able to hold it, and the kind of
+        its values : bool, int, float, str, or mixed for typed text values """
+
+        result = None
+        kind = 'mixed'
+
+        if isinstance(values, ndarray) and values.dtype.kind in self.s_kinds :
+            result = values
+            kind = self.s_kinds[values.dtype.kind]
+        else :
+            values = [value.item() if isinstance(value, generic) else value for value in values]
+            types = set(type(value) for value in values)
+            if types == {bool} :
+                kind = 'bool'
+            elif types == {int} :
+                kind = 'int'
+            elif types <= {int, float} :
+                kind = 'float'
+            elif types == {str} :
+                kind = 'str'
+
+            if kind == 'mixed' :
+                result = array([self.__mark(value) for value in values], dtype = str)
+            else :
+                result = array(values, dtype = kind)
+
+        return result, kind
@@ -10,7 +10,6 @@
 
 # System includes
 from threading import Lock
-from time      import sleep
 
 # Local includes
 from spike.scenario.scenario import Scenario
@@ -45,6 +44,10 @@ class Speaker() :
         self.__note       = 0
         self.__volume     = 0
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+        self.s_shared_timer    = ScenarioTimer()
+
         self.s_shared_scenario.register(self)
 
 # pylint: enable=W0102
@@ -149,10 +152,7 @@ class Speaker() :
         :type command: generator function
         """
 
-        shall_continue = next(command)
-        while shall_continue :
-            sleep(self.s_shared_timer.s_sleep_time)
-            shall_continue = next(command)
+        self.s_shared_scenario.process(command)
 
 ######################################## SCENARIO METHODS ########################################
 
@@ -184,7 +184,7 @@ class Speaker() :
 
         current_time = self.s_shared_timer.time()
         while self.s_shared_timer.time() - current_time < seconds :
-            sleep(0.01)
+            self.s_shared_scenario.wait(current_time + seconds)
 
         self.c_stop()
 
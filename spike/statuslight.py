@@ -10,7 +10,6 @@
 
 # System includes
 from threading import Lock
-from time      import sleep
 
 # Local includes
 from spike.scenario.scenario import Scenario
@@ -43,6 +42,10 @@ class StatusLight() :
         self.__color   = 'white'
         self.__is_on   = False
 
+        # Bind to the scenario of the creation context
+        self.s_shared_scenario = Scenario()
+        self.s_shared_timer    = ScenarioTimer()
+
         self.s_shared_scenario.register(self)
 
 # pylint: disable=C0103
@@ -84,10 +87,7 @@ class StatusLight() :
         :type command: generator function
         """
 
-        shall_continue = next(command)
-        while shall_continue :
-            sleep(self.s_shared_timer.s_sleep_time)
-            shall_continue = next(command)
+        self.s_shared_scenario.process(command)
 
 ######################################## SCENARIO METHODS ########################################
 
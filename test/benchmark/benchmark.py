@@ -0,0 +1,195 @@
+# -------------------------------------------------------
+# Copyright (c) [2022] Nadege LEMPERIERE
+# All rights reserved
+# -------------------------------------------------------
+# Benchmarks to track scenario performances
+# -------------------------------------------------------
+# Nadège LEMPERIERE, @04 november 2022
+# Latest revision: 04 november 2022
+# -------------------------------------------------------
+
+# System includes
+from os                         import path
+from sys                        import exit as sys_exit
+from json                       import load, dump
+from time                       import perf_counter
+from statistics                 import median
+from argparse                   import ArgumentParser
+from threading                  import Thread
+
+# Package includes
+from spike                      import Motor, MotorPair, ColorSensor
+from spike.control              import wait_for_seconds
+from spike.scenario.scenario    import Scenario
+from spike.scenario.timer       import ScenarioTimer
+from spike.scenario.model       import ScenarioModel
+from spike.scenario.data        import ScenarioData
+from spike.scenario.workbook    import ScenarioWorkbook
+
+BENCHMARK_DIRECTORY = path.dirname(path.abspath(__file__))
+CONF_DIRECTORY      = path.join(BENCHMARK_DIRECTORY, '..', '..', 'conf')
+SCENARIO_FILE       = path.join(BENCHMARK_DIRECTORY, 'scenario.json')
+ROBOT_FILE          = path.join(CONF_DIRECTORY, 'robot.json')
+DATA_FILE           = path.join(CONF_DIRECTORY, 'data.xlsx')
+BASELINE_FILE       = path.join(BENCHMARK_DIRECTORY, 'baseline.json')
+
+def latency(function, calls) :
+    """ Median duration of a function call in microseconds """
+    durations = []
+    for _ in range(calls) :
+        start = perf_counter()
+        function()
+        durations.append(perf_counter() - start)
+    return median(durations) * 1e6
+
+def robot(function) :
+    """ Run a benchmark on a started robot, in its own virtual time scenario """
+    scenario = Scenario(shared = False)
+    with scenario.bind() :
+        scenario.configure(SCENARIO_FILE, ROBOT_FILE)
+        scenario.start()
+        try :
+            result = function(scenario)
+        finally :
+            scenario.reset()
+    return result
+
+def tick_throughput(scenario) :
+    """ Scenario steps processed per second while the robot moves """
+    ticks = []
+    scenario.observe(lambda time, dynamics : ticks.append(time))
+    Motor('E')
+    Motor('F')
+    MotorPair('E', 'F').start(0, 50)
+    start = perf_counter()
+    wait_for_seconds(10)
+    return len(ticks) / (perf_counter() - start)
+
+def motor_run_for_degrees(scenario) :
+    """ Motor.run_for_degrees latency """
+    motor = Motor('E')
+    return latency(lambda : motor.run_for_degrees(90, 50), 20)
+
+def motorpair_move(scenario) :
+    """ MotorPair.move latency """
+    Motor('E')
+    Motor('F')
+    pair = MotorPair('E', 'F')
+    return latency(lambda : pair.move(5, 'cm', 0, 50), 20)
+
+def colorsensor_get_color(scenario) :
+    """ ColorSensor.get_color latency """
+    sensor = ColorSensor('A')
+    return latency(sensor.get_color, 10000)
+
+def clock_read_throughput(scenario) :
+    """ ScenarioTimer.time calls per second by 8 concurrent readers on a started scenario """
+    timer = ScenarioTimer()
+    reads = 50000
+    def read() :
+        for _ in range(reads) : timer.time()
+    readers = [Thread(target = read) for _ in range(8)]
+    start = perf_counter()
+    for reader in readers : reader.start()
+    for reader in readers : reader.join()
+    return len(readers) * reads / (perf_counter() - start)
+
+def data_extrapolate() :
+    """ ScenarioData.extrapolate latency along a scenario """
+    data = ScenarioData()
+    data.configure(DATA_FILE, 'color')
+    dates = iter([0.01 * i_date for i_date in range(2000)])
+    return latency(lambda : data.extrapolate('A_red', next(dates)), 2000)
+
+def model_configure_cached() :
+    """ ScenarioModel.configure latency when the robot is in the process cache """
+    ScenarioModel().configure(ROBOT_FILE)
+    return latency(lambda : ScenarioModel().configure(ROBOT_FILE), 10)
+
+def model_configure_uncached() :
+    """ ScenarioModel.configure latency when the robot is parsed from its ldraw model """
+    directories = (ScenarioWorkbook.s_cache_directory, ScenarioModel.s_cache_directory)
+    ScenarioWorkbook.configure(None)
+    ScenarioModel.configure_cache(None)
+    try :
+        def configure() :
+            ScenarioModel.s_cache.clear()
+            ScenarioModel().configure(ROBOT_FILE)
+        result = latency(configure, 3)
+    finally :
+        ScenarioWorkbook.configure(directories[0])
+        ScenarioModel.configure_cache(directories[1])
+    return result
+
+BENCHMARKS = {
+    'tick_throughput'           : ('ticks/s', 'higher', lambda : robot(tick_throughput)),
+    'motor_run_for_degrees'     : ('us', 'lower', lambda : robot(motor_run_for_degrees)),
+    'motorpair_move'            : ('us', 'lower', lambda : robot(motorpair_move)),
+    'colorsensor_get_color'     : ('us', 'lower', lambda : robot(colorsensor_get_color)),
+    'clock_read_throughput'     : ('reads/s', 'higher', lambda : robot(clock_read_throughput)),
+    'data_extrapolate'          : ('us', 'lower', data_extrapolate),
+    'model_configure_cached'    : ('us', 'lower', model_configure_cached),
+    'model_configure_uncached'  : ('us', 'lower', model_configure_uncached)
+}
+
+def measure(names, rounds) :
+    """ Median of each benchmark result over several rounds """
+    result = {}
+    for name in names :
+        unit, better, function = BENCHMARKS[name]
+        values = [function() for _ in range(rounds)]
+        result[name] = { 'value' : median(values), 'unit' : unit, 'better' : better }
+        print(f'{name:<28} {result[name]["value"]:>14.1f} {unit}')
+    return result
+
+def compare(results, baseline, tolerance) :
+    """ Benchmarks which performances decreased more than the tolerance from the baseline """
+    result = []
+    for name, measured in results.items() :
+        if name in baseline :
+            reference = baseline[name]['value']
+            if measured['better'] == 'lower' : ratio = measured['value'] / reference
+            else : ratio = reference / measured['value']
+            status = 'ok'
+            if ratio > 1 + tolerance :
+                status = 'REGRESSION'
+                result.append(name)
+            print(f'{name:<28} {ratio:>8.2f} x baseline  {status}')
+    return result
+
+def main() :
+    """ Benchmark command line entry point """
+
+    parser = ArgumentParser(description = 'Measure scenario performances against a baseline')
+    parser.add_argument('--baseline', default = BASELINE_FILE, help = 'baseline json file')
+    parser.add_argument('--update', action = 'store_true',
+        help = 'store the measured performances as the new baseline')
+    parser.add_argument('--tolerance', type = float, default = 0.5,
+        help = 'accepted performance decrease ratio before reporting a regression')
+    parser.add_argument('--rounds', type = int, default = 3, help = 'measurements per benchmark')
+    parser.add_argument('--output', default = None, help = 'json file to store results in')
+    parser.add_argument('names', nargs = '*', default = list(BENCHMARKS.keys()),
+        help = 'benchmarks to run, all by default')
+    args = parser.parse_args()
+
+    results = measure(args.names, args.rounds)
+    if args.output is not None :
+        with open(args.output, 'w', encoding='UTF-8') as file :
+            dump(results, file, indent = 4)
+            file.close()
+
+    regressions = []
+    if args.update :
+        with open(args.baseline, 'w', encoding='UTF-8') as file :
+            dump(results, file, indent = 4)
+            file.close()
+    elif path.isfile(args.baseline) :
+        with open(args.baseline, 'r', encoding='UTF-8') as file :
+            baseline = load(file)
+            file.close()
+        regressions = compare(results, baseline, args.tolerance)
+
+    sys_exit(1 if len(regressions) > 0 else 0)
+
+if __name__ == '__main__' :
+    main()
@@ -8,19 +8,118 @@
 # Latest revision: 1 november 2022
 # -------------------------------------------------------
 
+# System includes
+from os import path
+from glob import glob
+
 # Robotframework includes
 from robot.libraries.BuiltIn import BuiltIn, _Misc
 from robot.api import logger as logger
 from robot.api.deco import keyword
 ROBOT = False
 
+# Numpy includes
+from numpy import ndarray, nan, isnan
+
 # Package includes
 from spike.scenario.data            import ScenarioData
+from spike.scenario.workbook        import ScenarioWorkbook
+from spike.scenario.components      import ScenarioComponents
+from spike.button                   import Button
 
 @keyword('Load Data')
-def load_data(filename, sheet) :
+def load_data(filename, sheet, stream = None) :
 
     data = ScenarioData()
-    data.configure(filename, sheet)
+    if stream is not None : stream = int(stream)
+    data.configure(filename, sheet, stream)
 
     return data
+
+@keyword('Convert Workbook')
+def convert_workbook(source, destination) :
+
+    workbook = ScenarioWorkbook(source)
+    workbook.save(destination)
+
+@keyword('Configure Workbook Cache')
+def configure_workbook_cache(directory) :
+
+    result = ScenarioWorkbook.s_cache_directory
+    ScenarioWorkbook.configure(directory)
+    return result
+
+@keyword('Update Button From Data')
+def update_button_from_data(data, side, date) :
+
+    # The button is only registered, not connected to the shared scenario
+    components = ScenarioComponents()
+    components.register(Button.__new__(Button), side, None)
+    components.update_from_data(float(date), data)
+
+@keyword('Round Trip Columns Through Numpy Archive')
+def round_trip_columns_through_numpy_archive(filename) :
+
+    def same(value, expected) :
+        return type(value) is type(expected) and \
+            (value == expected or (isinstance(value, float) and isnan(value) and isnan(expected)))
+
+    columns = {
+        'integers' : [1, 2, 3, 4, 5, 6],
+        'floats'   : [1.5, nan, 2.0, -3.25, 0.0, 1e-9],
+        'booleans' : [True, False, False, True, True, False],
+        'texts'    : ['12', '', 'a', 'True', '2.5', 'None'],
+        'mixed'    : ['12', None, 3, 2.5, True, '']
+    }
+    ScenarioWorkbook(filename).write({ 'sheet' : columns })
+
+    # Reading the archive fails if it goes through row iteration
+    workbook = ScenarioWorkbook(filename)
+    def rows(sheet) :
+        raise RuntimeError('Sheet ' + sheet + ' read row by row')
+    workbook.rows = rows
+    content = workbook.read('sheet')
+    streamed = list(ScenarioWorkbook(filename).rows('sheet'))
+
+    identical = list(content.keys()) == list(columns.keys()) and \
+        streamed[0] == list(columns.keys())
+    for i_column, (header, expected) in enumerate(columns.items()) :
+        values = content[header]
+        if isinstance(values, ndarray) : values = values.tolist()
+        identical = identical and len(values) == len(expected) and \
+            all(same(value, reference) for value, reference in zip(values, expected)) and \
+            all(same(row[i_column], reference) for row, reference in zip(streamed[1:], expected))
+
+    typed = [content[header] for header in ['integers', 'floats', 'booleans', 'texts']]
+    return {
+        'identical' : identical,
+        'arrays'    : all(isinstance(values, ndarray) for values in typed),
+        'mapped'    : all(not values.flags.owndata and not values.flags.writeable \
+            for values in typed)
+    }
+
+@keyword('Read Workbook Through Bounded Cache')
+def read_workbook_through_bounded_cache(filename, size, *sheets) :
+
+    previous = ScenarioWorkbook.s_cache_size
+    ScenarioWorkbook.s_cache_size = int(size)
+    try :
+        for sheet in sheets : ScenarioWorkbook(filename).read(sheet)
+        result = {
+            'size'   : len(ScenarioWorkbook.s_cache),
+            'sheets' : [key[2] for key in ScenarioWorkbook.s_cache \
+                if key[0] == path.abspath(filename)]
+        }
+    finally :
+        ScenarioWorkbook.s_cache_size = previous
+
+    return result
+
+@keyword('Corrupt Workbook Cache')
+def corrupt_workbook_cache(directory) :
+
+    ScenarioWorkbook.s_cache.clear()
+    for filename in glob(path.join(directory, '*.npz')) :
+        with open(filename, 'wb') as file :
+            file.write(b'not an archive')
+            file.close()
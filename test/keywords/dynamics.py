@@ -10,6 +10,9 @@
 
 # System includes
 from math import pi
+from os import path, makedirs
+from json import load as load_json, dump as dump_json
+from logging import getLogger, Handler
 
 # Robotframework includes
 from robot.libraries.BuiltIn import BuiltIn, _Misc
@@ -29,6 +32,8 @@ from spike.scenario.model       import ScenarioModel
 from spike.scenario.parts       import ScenarioPart, ScenarioPartColorSensor, ScenarioPartMotor
 from spike.scenario.ground      import ScenarioGround
 from spike.scenario.parts       import ScenarioPartWheel
+from spike.scenario.workbook    import ScenarioWorkbook
+from spike.scenario.trace       import ScenarioTrace
 
 
 @keyword('Create Model')
@@ -38,6 +43,80 @@ def create_model(configuration) :
     model.configure(configuration)
     return model
 
+@keyword('Clear Model Cache')
+def clear_model_cache(directory) :
+
+    result = ScenarioModel.s_cache_directory
+    ScenarioModel.configure_cache(directory)
+    ScenarioModel.s_cache.clear()
+    return result
+
+@keyword('Set Model Cache Version')
+def set_model_cache_version(version) :
+
+    result = ScenarioModel.s_cache_version
+    ScenarioModel.s_cache_version = version
+    return result
+
+
+@keyword('Create Model With Scaled Abaqus')
+def create_model_with_scaled_abaqus(configuration, ratio, directory) :
+
+    conf = {}
+    with open(configuration, 'r', encoding='UTF-8') as file :
+        conf = load_json(file)
+        file.close()
+    origin = path.dirname(path.abspath(configuration))
+
+    # Scale the motors speed and wheels diameter of the robot abaqus
+    workbook = ScenarioWorkbook(path.join(origin, conf['abaqus']))
+    content = {}
+    for sheet in workbook.sheets() :
+        content[sheet] = workbook.read(sheet)
+    content['motor-command']['speed'] = \
+        [None if value is None else value * float(ratio) for value in content['motor-command']['speed']]
+    content['wheel-diameter']['diameter'] = \
+        [None if value is None else value * float(ratio) for value in content['wheel-diameter']['diameter']]
+    makedirs(directory, exist_ok = True)
+    ScenarioWorkbook(path.join(directory, 'abaqus.npz')).write(content)
+
+    conf['abaqus'] = 'abaqus.npz'
+    conf['design'] = dict(conf['design'])
+    conf['design']['filename'] = path.relpath(path.join(origin, conf['design']['filename']), directory)
+    with open(path.join(directory, 'robot.json'), 'w', encoding='UTF-8') as file :
+        dump_json(conf, file)
+        file.close()
+
+    return create_model(path.join(directory, 'robot.json'))
+
+@keyword('Create Model With Component')
+def create_model_with_component(configuration, directory, type, identifier, port, index) :
+
+    conf = {}
+    with open(configuration, 'r', encoding='UTF-8') as file :
+        conf = load_json(file)
+        file.close()
+    origin = path.dirname(path.abspath(configuration))
+
+    # Connect the component first, so that it is checked before the robot ones
+    conf['components'] = [{ 'type' : type, 'id' : identifier, 'port' : port, 'index' : int(index) }] + \
+        conf['components']
+    conf['design'] = dict(conf['design'])
+    conf['design']['filename'] = path.relpath(path.join(origin, conf['design']['filename']), directory)
+    conf['abaqus'] = path.relpath(path.join(origin, conf['abaqus']), directory)
+    makedirs(directory, exist_ok = True)
+    with open(path.join(directory, 'robot.json'), 'w', encoding='UTF-8') as file :
+        dump_json(conf, file)
+        file.close()
+
+    return create_model(path.join(directory, 'robot.json'))
+
+@keyword('Motor Speed For Command')
+def motor_speed_for_command(model, port, command) :
+
+    motor = model.by_port()[port][0]
+    motor.command(int(command))
+    return motor.speed
 @keyword('Create Dynamics')
 def create_dynamics(model, north, east, yaw) :
 
@@ -119,8 +198,37 @@ def create_pose(x, y, z, roll, pitch, yaw) :
     return pose
 
 @keyword('Create Mat')
-def create_mat(image, path) :
+def create_mat(image, path, shared = False, aperture = None, tiles = None) :
 
+    conf = {'image' : image, 'scale' : 0.1, 'shared' : shared}
+    if aperture is not None : conf['aperture'] = float(aperture)
+    if tiles is not None : conf['tiles'] = tiles
     mat = ScenarioGround()
-    mat.configure({'image' : image, 'scale' : 0.1}, path)
+    mat.configure(conf, path)
     return mat
+
+@keyword('Count Trace Formatting')
+def count_trace_formatting(subsystem, level) :
+
+    class Counted :
+        count = 0
+        def __str__(self) :
+            Counted.count += 1
+            return 'counted'
+
+    class Formatter(Handler) :
+        def emit(self, record) :
+            self.format(record)
+
+    logger = getLogger(subsystem)
+    previous = logger.level
+    handler = Formatter()
+    logger.addHandler(handler)
+    ScenarioTrace.configure({subsystem : level})
+    try :
+        ScenarioTrace(subsystem).trace('%s', Counted())
+    finally :
+        logger.removeHandler(handler)
+        logger.setLevel(previous)
+
+    return Counted.count
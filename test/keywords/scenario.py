@@ -9,7 +9,13 @@
 # -------------------------------------------------------
 
 # System includes
+from csv import reader
+from json import dump, load as load_json
+from os import path
+from sys import path as sys_path
 from time import time, sleep as local_sleep # To avoid conflict with the Sleep keyword...
+from threading import Thread
+from gc import collect
 
 # Robotframework includes
 from robot.libraries.BuiltIn import BuiltIn, _Misc
@@ -17,8 +23,20 @@ from robot.api import logger as logger
 from robot.api.deco import keyword
 ROBOT = False
 
+# Numpy includes
+from numpy import load, diff
+
 # Package includes
 from spike.scenario.scenario    import Scenario
+from spike.scenario.timer       import ScenarioTimer
+from spike.control              import wait_for_seconds, Timer
+from spike.motor                import Motor
+from spike.motorpair            import MotorPair
+from spike.colorsensor          import ColorSensor
+from spike.motionsensor         import MotionSensor
+from spike.forcesensor          import ForceSensor
+from spike.scenario.batch       import ScenarioBatch
+from spike.scenario.waiters     import ScenarioWaiters
 
 @keyword('Create Scenario')
 def create_scenario(configuration, robot, sheet) :
@@ -41,6 +59,10 @@ def play_scenario_during_steps(step) :
 
     return result
 
+@keyword('Wait Scenario During Seconds')
+def wait_scenario_during_seconds(seconds) :
+    wait_for_seconds(float(seconds))
+
 @keyword('Stop Scenario')
 def stop_scenario(scenario) :
     scenario.stop()
@@ -52,3 +74,263 @@ def reset_scenario(scenario) :
 @keyword('Get Time Milliseconds')
 def get_time_milliseconds() :
     return int(round(time() * 1000)) * 1.0 / 1000
+
+@keyword('Check Concurrent Clock Reads')
+def check_concurrent_clock_reads(threads, reads) :
+
+    timer = ScenarioTimer()
+    monotonic = []
+
+    def reader() :
+        previous = timer.time()
+        result = True
+        for _ in range(int(reads)) :
+            current = timer.time()
+            result = result and current >= previous
+            previous = current
+        monotonic.append(result)
+
+    readers = [Thread(target = reader) for _ in range(int(threads))]
+    for thread in readers : thread.start()
+    for thread in readers : thread.join()
+
+    return all(monotonic)
+
+@keyword('Run Independent Scenarios')
+def run_independent_scenarios(configuration, robot, sheet, durations) :
+
+    results = {}
+
+    def run(duration) :
+        scenario = Scenario(shared = False)
+        with scenario.bind() :
+            scenario.configure(configuration, robot, sheet)
+            scenario.start()
+            timer = Timer()
+            motor = Motor('E')
+            timer.reset()
+            motor.run_for_seconds(float(duration), 50)
+            results[duration] = {
+                'delay'   : timer.now(),
+                'degrees' : motor.get_degrees_counted(),
+                'bound'   : Scenario() is scenario and ScenarioTimer() is scenario.timer()
+            }
+            scenario.stop()
+
+    runners = [Thread(target = run, args = (duration,)) for duration in durations]
+    for thread in runners : thread.start()
+    for thread in runners : thread.join()
+
+    return [results[duration] for duration in durations]
+
+def move_forward(scenario) :
+
+    Motor('E')
+    Motor('F')
+    MotorPair('E', 'F').move(20, 'cm', 0, 50)
+    return scenario.timer().time()
+
+@keyword('Run Scenario Batch')
+def run_scenario_batch(configuration, robot, coordinates, workers, capacity = None) :
+
+    if capacity is not None : capacity = int(capacity)
+    batch = ScenarioBatch(configuration, robot, int(workers), capacity)
+
+    # Spawned workers import the missions of this module from the python path
+    directory = path.dirname(path.abspath(__file__))
+    sys_path.insert(0, directory)
+    try :
+        result = batch.run(coordinates, None, [move_forward, None])
+    finally :
+        sys_path.remove(directory)
+
+    return result
+
+@keyword('Record Scenario Move')
+def record_scenario_move(configuration, robot, capacity, filename) :
+
+    scenario = Scenario()
+    scenario.configure(configuration, robot, 'time')
+    recorder = scenario.record(int(capacity))
+    scenario.start()
+    Motor('E')
+    Motor('F')
+    MotorPair('E', 'F').move(20, 'cm', 0, 50)
+    scenario.stop()
+
+    recorder.save(filename + '.npz')
+    recorder.save(filename + '.csv')
+    exportable = True
+    try :
+        recorder.export(filename + '.replay.npz', 'replay')
+    except ValueError :
+        exportable = False
+    data = recorder.data()
+    exported = load(filename + '.npz')
+    with open(filename + '.csv', 'r', encoding='UTF-8', newline='') as file :
+        rows = list(reader(file))
+        file.close()
+
+    result = {
+        'size'     : recorder.size(),
+        'dropped'  : recorder.dropped(),
+        'exportable' : exportable,
+        'archived' : int(exported['dropped']),
+        'views'    : len(recorder.views()),
+        'shared'   : all(view.base is not None for view in recorder.views()),
+        'ordered'  : bool((diff(recorder.column('time')) > 0).all()),
+        'north'    : recorder.column('north')[-1],
+        'npz'      : all((exported[name] == data[:, i_column]).all() \
+            for i_column, name in enumerate(recorder.columns())),
+        'csv'      : rows[0] == recorder.columns() and len(rows) == recorder.size() + 1 and \
+            [float(value) for value in rows[-1]] == data[-1].tolist()
+    }
+    scenario.reset()
+
+    return result
+
+@keyword('Replay Recorded Scenario')
+def replay_recorded_scenario(configuration, robot, filename) :
+
+    # Record a computed scenario
+    scenario = Scenario()
+    scenario.configure(configuration, robot, 'time')
+    recorder = scenario.record()
+    scenario.start()
+    Motor('E')
+    Motor('F')
+    ColorSensor('A')
+    MotorPair('E', 'F').move(30, 'cm', 30, 50)
+    scenario.stop()
+    recorder.export(filename, 'replay')
+    scenario.reset()
+
+    # Values received by the components at a recorded date
+    date = recorder.column('time')[-2]
+    recorded = {
+        'degrees' : int(round(recorder.column('E_degrees')[-2])),
+        'yaw'     : int(round(recorder.column('yaw')[-2])),
+        'red'     : recorder.column('A_red')[-2] * 1024 / 255
+    }
+
+    # Replay it in read mode up to this date
+    replay = path.splitext(filename)[0] + '.json'
+    with open(replay, 'w', encoding='UTF-8') as file :
+        dump({
+            'data' : { 'mode' : 'read', 'filename' : path.basename(filename) },
+            'time' : { 'mode' : 'controlled', 'period' : date }
+        }, file)
+        file.close()
+    scenario.configure(replay, robot, 'replay')
+    scenario.start()
+    left = Motor('E')
+    sensor = ColorSensor('A')
+    motion = MotionSensor()
+    scenario.step()
+    replayed = {
+        'degrees' : left.get_degrees_counted(),
+        'yaw'     : motion.get_yaw_angle(),
+        'red'     : sensor.get_rgb_intensity()[0]
+    }
+
+    # Components not recorded can not be replayed, whether created before or after start
+    missing = ''
+    try :
+        ForceSensor('B')
+    except ValueError as exc :
+        missing = str(exc)
+    scenario.reset()
+    refused = ''
+    scenario.configure(replay, robot, 'replay')
+    ForceSensor('B')
+    try :
+        scenario.start()
+    except ValueError as exc :
+        refused = str(exc)
+    scenario.reset()
+
+    return { 'recorded' : recorded, 'replayed' : replayed, 'missing' : missing,
+        'refused' : refused }
+
+@keyword('Profile Scenario Move')
+def profile_scenario_move(configuration, robot, filename) :
+
+    scenario = Scenario()
+    scenario.configure(configuration, robot, 'time')
+    profiler = scenario.profile(filename)
+    scenario.start()
+    Motor('E')
+    Motor('F')
+    ColorSensor('A')
+    MotorPair('E', 'F').move(20, 'cm', 0, 50)
+    scenario.stop()
+    scenario.reset()
+
+    report = {}
+    with open(filename, 'r', encoding='UTF-8') as file :
+        report = load_json(file)
+        file.close()
+
+    result = {
+        'dumped'     : report == profiler.report(),
+        'missed'     : report['missed'],
+        'counts'     : {},
+        'histograms' : True,
+        'phases'     : 0,
+        'tick'       : report['phases']['tick']['mean']
+    }
+    for phase, statistics in report['phases'].items() :
+        result['counts'][phase] = statistics['count']
+        result['histograms'] = result['histograms'] and \
+            sum(statistics['histogram']) == statistics['count']
+        if phase not in ['tick', 'interval'] : result['phases'] += statistics['mean']
+
+    return result
+
+@keyword('Wait For Component Updated Before Waiting')
+def wait_for_component_updated_before_waiting(steps) :
+
+    class Component :
+        pass
+
+    waiters = ScenarioWaiters()
+    component = Component()
+    waiters.open()
+
+    # The component changes between its check and the registration of the waiter
+    changes = waiters.changes(component)
+    waiters.notify([component])
+    caller = Thread(target = waiters.wait, kwargs = { 'component' : component, 'changes' : changes })
+    caller.start()
+    for _ in range(int(steps)) :
+        waiters.notify([])
+        local_sleep(0.01)
+    caller.join(1)
+    result = not caller.is_alive()
+
+    waiters.close()
+    caller.join()
+
+    return result
+
+@keyword('Count Changes Of Component Replacing Deleted One')
+def count_changes_of_component_replacing_deleted_one(updates) :
+
+    class Component :
+        pass
+
+    waiters = ScenarioWaiters()
+    component = Component()
+    for _ in range(int(updates)) :
+        waiters.notify([component])
+
+    # Allocate new components until one is allocated where the deleted one was
+    identifier = id(component)
+    del component
+    collect()
+    components = [Component()]
+    while id(components[-1]) != identifier and len(components) < 100000 :
+        components.append(Component())
+    result = waiters.changes(components[-1])
+
+    return result